@@ -25,6 +25,24 @@ async def check_inactive_chats_job():
 
         print(f"📅 Проверяем сообщения за: {yesterday_start} - {yesterday_end}")
 
+        # Последняя активность по всем чатам — постранично из chat_activity
+        last_activity = {}
+        offset = 0
+        while True:
+            activity_resp = (
+                supabase.table("chat_activity")
+                .select("chat_id, last_message_at")
+                .order("chat_id")
+                .range(offset, offset + 999)
+                .execute()
+            )
+            page = activity_resp.data or []
+            for row in page:
+                last_activity[str(row["chat_id"])] = row["last_message_at"]
+            if len(page) < 1000:
+                break
+            offset += 1000
+
         for chat in chats:
             chat_id = chat.get("chat_id")
             chat_name = chat.get("chat_name", "Unknown")
@@ -36,17 +54,27 @@ async def check_inactive_chats_job():
 
             try:
                 # Проверяем, были ли сообщения вчера
-                messages = (
-                    supabase.table("chat_log")
-                    .select("id")
-                    .eq("chat_id", chat_id)
-                    .gte("timestamp", yesterday_start)
-                    .lt("timestamp", yesterday_end)
-                    .limit(1)
-                    .execute()
-                )
-
-                if messages.data:
+                last_message_at = last_activity.get(str(chat_id))
+                last_message_at = parse_supabase_timestamp(last_message_at) if last_message_at else None
+
+                if last_message_at is None or last_message_at < datetime.fromisoformat(yesterday_start):
+                    had_messages = False
+                elif last_message_at < datetime.fromisoformat(yesterday_end):
+                    had_messages = True
+                else:
+                    # Последнее сообщение сегодня — про вчера оно ничего не говорит
+                    messages = (
+                        supabase.table("chat_log")
+                        .select("id")
+                        .eq("chat_id", chat_id)
+                        .gte("timestamp", yesterday_start)
+                        .lt("timestamp", yesterday_end)
+                        .limit(1)
+                        .execute()
+                    )
+                    had_messages = bool(messages.data)
+
+                if had_messages:
                     # Были сообщения — всё ок
                     print(f"✅ {chat_name}: активность есть")
                     continue
@@ -23,16 +23,69 @@ class Settings:
 
     # Telegram
     telegram_token: str = field(default_factory=lambda: os.getenv("TELEGRAM_TOKEN", ""))
+    telegram_rate_limit: float = field(default_factory=lambda: float(os.getenv("TELEGRAM_RATE_LIMIT", "25")))
     owner_id: int = field(default_factory=lambda: int(os.getenv("OWNER_ID", "1139575259")))
     project_ids: List[int] = field(default_factory=list)
 
     # OpenAI
     openai_api_key: str = field(default_factory=lambda: os.getenv("OPENAI_API_KEY", ""))
     openai_model: str = "gpt-4o-mini"
+    openai_timeout: float = field(default_factory=lambda: float(os.getenv("OPENAI_TIMEOUT", "30")))
+    openai_max_concurrency: int = field(default_factory=lambda: int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")))
+    # Лимиты параллельных запросов по моделям: OPENAI_MODEL_CONCURRENCY="gpt-4o-mini=16,gpt-4o=4"
+    openai_model_concurrency: dict = field(default_factory=dict)
+
+    # Пакетная классификация "нужен ли ответ" (окно в мс и максимальный размер пачки)
+    need_answer_batch_window_ms: int = field(default_factory=lambda: int(os.getenv("NEED_ANSWER_BATCH_WINDOW_MS", "300")))
+    need_answer_batch_size: int = field(default_factory=lambda: int(os.getenv("NEED_ANSWER_BATCH_SIZE", "10")))
+
+    # Кэш ответов GPT-классификаторов (need-answer, договорённости)
+    response_cache_size: int = field(default_factory=lambda: int(os.getenv("RESPONSE_CACHE_SIZE", "5000")))
+    response_cache_ttl: int = field(default_factory=lambda: int(os.getenv("RESPONSE_CACHE_TTL", "86400")))  # секунды
+    response_cache_path: str = field(default_factory=lambda: os.getenv("RESPONSE_CACHE_PATH", ""))  # пусто — только в памяти
+
+    # Последние сообщения чатов в памяти (контекст для GPT без запросов к БД)
+    chat_history_size: int = field(default_factory=lambda: int(os.getenv("CHAT_HISTORY_SIZE", "20")))
+    chat_history_max_chats: int = field(default_factory=lambda: int(os.getenv("CHAT_HISTORY_MAX_CHATS", "2000")))
+    chat_history_idle_hours: int = field(default_factory=lambda: int(os.getenv("CHAT_HISTORY_IDLE_HOURS", "24")))
+
+    # Параллельная генерация праздничных поздравлений
+    holiday_greeting_concurrency: int = field(default_factory=lambda: int(os.getenv("HOLIDAY_GREETING_CONCURRENCY", "10")))
+
+    # Максимум одновременных процессов FFmpeg/ffprobe (транскрибация встреч)
+    ffmpeg_max_processes: int = field(default_factory=lambda: int(os.getenv("FFMPEG_MAX_PROCESSES", "2")))
+
+    # Whisper: параллельные запросы на распознавание частей, таймаут и повторы
+    whisper_concurrency: int = field(default_factory=lambda: int(os.getenv("WHISPER_CONCURRENCY", "4")))
+    whisper_timeout: float = field(default_factory=lambda: float(os.getenv("WHISPER_TIMEOUT", "300")))
+    whisper_retries: int = field(default_factory=lambda: int(os.getenv("WHISPER_RETRIES", "2")))
+    whisper_split_mode: str = field(default_factory=lambda: os.getenv("WHISPER_SPLIT_MODE", "segment"))  # segment / seek
+    whisper_stream_segment_seconds: int = field(default_factory=lambda: int(os.getenv("WHISPER_STREAM_SEGMENT_SECONDS", "300")))
+
+    # Кэш транскрипций встреч (0 МБ — отключён)
+    transcript_cache_dir: str = field(default_factory=lambda: os.getenv("TRANSCRIPT_CACHE_DIR", "data/transcripts"))
+    transcript_cache_max_mb: int = field(default_factory=lambda: int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "100")))
+
+    # Саммари длинных встреч: map_reduce (по частям) или truncate (начало + конец)
+    meeting_summary_mode: str = field(default_factory=lambda: os.getenv("MEETING_SUMMARY_MODE", "map_reduce"))
+    meeting_summary_chunk_chars: int = field(default_factory=lambda: int(os.getenv("MEETING_SUMMARY_CHUNK_CHARS", "15000")))
+
+    # Ежемесячная допродажа: параллельные GPT-запросы и их частота (в секунду)
+    upsell_concurrency: int = field(default_factory=lambda: int(os.getenv("UPSELL_CONCURRENCY", "5")))
+    upsell_rate_limit: float = field(default_factory=lambda: float(os.getenv("UPSELL_RATE_LIMIT", "2")))
+
+    # Факты о клиенте из сообщений проджектов: писать ли их в базу знаний без подтверждения
+    client_facts_autosave: bool = field(default_factory=lambda: os.getenv("CLIENT_FACTS_AUTOSAVE", "false").lower() == "true")
 
     # Supabase
     supabase_url: str = field(default_factory=lambda: os.getenv("SUPABASE_URL", ""))
     supabase_key: str = field(default_factory=lambda: os.getenv("SUPABASE_KEY", ""))
+    supabase_timeout: int = field(default_factory=lambda: int(os.getenv("SUPABASE_TIMEOUT", "10")))
+
+    # Запись chat_log: "direct" — insert на каждое сообщение, "buffered" — пачками
+    chat_log_write_mode: str = field(default_factory=lambda: os.getenv("CHAT_LOG_WRITE_MODE", "direct"))
+    chat_log_flush_size: int = field(default_factory=lambda: int(os.getenv("CHAT_LOG_FLUSH_SIZE", "50")))
+    chat_log_flush_interval_ms: int = field(default_factory=lambda: int(os.getenv("CHAT_LOG_FLUSH_INTERVAL_MS", "500")))
 
     # Webhook
     webhook_port: int = field(default_factory=lambda: int(os.getenv("WEBHOOK_PORT", "8081")))
@@ -44,6 +97,10 @@ class Settings:
 
     # Bitrix24
     bitrix_webhook_url: str = field(default_factory=lambda: os.getenv("BITRIX_WEBHOOK_URL", ""))
+    bitrix_timeout: float = field(default_factory=lambda: float(os.getenv("BITRIX_TIMEOUT", "15")))
+    bitrix_connect_timeout: float = field(default_factory=lambda: float(os.getenv("BITRIX_CONNECT_TIMEOUT", "5")))
+    bitrix_pool_size: int = field(default_factory=lambda: int(os.getenv("BITRIX_POOL_SIZE", "10")))
+    bitrix_cache_ttl: int = field(default_factory=lambda: int(os.getenv("BITRIX_CACHE_TTL", "3600")))  # секунды
 
     # Маппинг Telegram ID -> Bitrix24 User ID
     telegram_to_bitrix: dict = field(default_factory=lambda: {
@@ -65,8 +122,14 @@ class Settings:
     # Задержки напоминаний (в секундах)
     escalation_delays: List[int] = field(default_factory=lambda: [15 * 60, 30 * 60, 60 * 60])
 
+    # Движок эскалаций: "jobs" — job на каждое сообщение, "sweeper" — единый периодический цикл
+    escalation_mode: str = field(default_factory=lambda: os.getenv("ESCALATION_MODE", "jobs"))
+    escalation_sweep_interval: int = field(default_factory=lambda: int(os.getenv("ESCALATION_SWEEP_INTERVAL", "60")))
+    escalation_sweep_batch: int = field(default_factory=lambda: int(os.getenv("ESCALATION_SWEEP_BATCH", "500")))
+    escalation_sweep_concurrency: int = field(default_factory=lambda: int(os.getenv("ESCALATION_SWEEP_CONCURRENCY", "10")))
+
     def __post_init__(self):
-        """Загрузка PROJECT_IDS из env или дефолтных значений."""
+        """Загрузка PROJECT_IDS и лимитов OpenAI из env или дефолтных значений."""
         project_ids_str = os.getenv("PROJECT_IDS", "")
         if project_ids_str:
             self.project_ids = [int(x.strip()) for x in project_ids_str.split(",") if x.strip()]
@@ -81,6 +144,12 @@ class Settings:
                 904374872,   # Li
             ]
 
+        model_concurrency_str = os.getenv("OPENAI_MODEL_CONCURRENCY", "")
+        for item in model_concurrency_str.split(","):
+            if "=" in item:
+                model, limit = item.split("=", 1)
+                self.openai_model_concurrency[model.strip()] = int(limit.strip())
+
     def validate(self) -> None:
         """Проверка обязательных настроек."""
         errors = []
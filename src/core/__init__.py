@@ -1,6 +1,10 @@
 """Ядро приложения — бот, база данных, планировщик."""
 
+from .chat_activity import chat_activity
+from .chat_cache import chat_cache
+from .chat_history import chat_history
 from .database import db
-from .bot import bot, dp
+from .async_database import async_db
+from .bot import bot, dp, send_message_throttled
 
-__all__ = ["db", "bot", "dp"]
+__all__ = ["db", "async_db", "chat_activity", "chat_cache", "chat_history", "bot", "dp", "send_message_throttled"]
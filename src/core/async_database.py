@@ -0,0 +1,920 @@
+"""
+Асинхронная работа с базой данных Supabase.
+
+Те же методы, что и у Database, но поверх асинхронного PostgREST-клиента
+с пулом HTTP-соединений — запросы не блокируют event loop.
+"""
+
+from datetime import datetime, timezone
+from typing import Any
+
+from postgrest import AsyncPostgrestClient
+
+from src.config import settings
+from src.core.chat_activity import chat_activity
+from src.core.chat_cache import MISSING, chat_cache
+from src.core.chat_history import chat_history
+from src.core.chat_log_buffer import ChatLogBuffer
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Предел строк в одном ответе PostgREST (max-rows по умолчанию)
+MAX_ROWS = 1000
+
+
+class AsyncDatabase:
+    """Асинхронный класс для работы с Supabase."""
+
+    def __init__(self):
+        self._client: AsyncPostgrestClient | None = None
+        self._log_buffer: ChatLogBuffer | None = None
+        if settings.chat_log_write_mode == "buffered":
+            self._log_buffer = ChatLogBuffer(
+                write_rows=self._write_log_rows,
+                reserve_ids=self._reserve_log_ids,
+                load_recent_keys=self._load_recent_thread_keys,
+                flush_size=settings.chat_log_flush_size,
+                flush_interval_ms=settings.chat_log_flush_interval_ms,
+            )
+
+    @property
+    def client(self) -> AsyncPostgrestClient:
+        """Ленивая инициализация клиента."""
+        if self._client is None:
+            self._client = AsyncPostgrestClient(
+                f"{settings.supabase_url.rstrip('/')}/rest/v1",
+                headers={
+                    "apikey": settings.supabase_key,
+                    "Authorization": f"Bearer {settings.supabase_key}",
+                },
+                timeout=settings.supabase_timeout,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Дописывает буфер chat_log целиком и закрывает пул HTTP-соединений."""
+        if self._log_buffer is not None:
+            await self._log_buffer.drain()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ============ CHAT LOG ============
+
+    async def flush(self) -> None:
+        """Записывает в БД накопленные строки chat_log (режим buffered)."""
+        if self._log_buffer is not None:
+            await self._log_buffer.flush()
+
+    async def _reserve_log_ids(self, count: int) -> list[int]:
+        """Резервирует блок id chat_log (SQL-функция reserve_chat_log_ids)."""
+        result = await self.client.rpc("reserve_chat_log_ids", {"p_count": count}).execute()
+        return [int(log_id) for log_id in result.data or []]
+
+    async def _load_recent_thread_keys(self) -> list[str]:
+        """thread_key последних MAX_ROWS сообщений — для отсечения повторной доставки."""
+        result = await (
+            self.client.table("chat_log")
+            .select("thread_key")
+            .order("id", desc=True)
+            .limit(MAX_ROWS)
+            .execute()
+        )
+        return [row["thread_key"] for row in result.data or [] if row.get("thread_key")]
+
+    async def _write_log_rows(self, rows: list[dict]) -> list[dict]:
+        """
+        Пакетная вставка chat_log (ON CONFLICT (thread_key) DO NOTHING).
+
+        Returns:
+            list[dict]: Вставленные строки — дубликатов среди них нет
+        """
+        result = await self.client.table("chat_log").upsert(
+            rows, on_conflict="thread_key", ignore_duplicates=True
+        ).execute()
+        return result.data or []
+
+    async def log_message(
+        self,
+        chat_id: str,
+        message_id: int,
+        from_id: int,
+        from_name: str,
+        text: str,
+        chat_name: str,
+        is_project: bool,
+    ) -> dict | None:
+        """
+        Логирует сообщение в БД.
+
+        Returns:
+            dict | None: Созданная запись или None при ошибке/дубликате
+        """
+        try:
+            thread_key = f"{chat_id}:{message_id}"
+
+            data = {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "chat_name": chat_name,
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "thread_key": thread_key,
+                "from_id": from_id,
+                "from_name": from_name,
+                "is_project": is_project,
+                "project_id": from_id if is_project else None,
+                "text": text,
+                "status": "logged",
+            }
+
+            if self._log_buffer is not None:
+                try:
+                    row = await self._log_buffer.add(data)
+                    if row is None:
+                        return None
+                    chat_activity.touch(chat_id, data["timestamp"])
+                    chat_history.append(chat_id, message_id, from_name, text, is_project)
+                    return row
+                except Exception as e:
+                    # Очередь переполнена или БД недоступна для резерва id — пишем напрямую
+                    logger.error(f"Error buffering message, writing directly: {e}")
+
+            result = await self.client.table("chat_log").insert(data).execute()
+            chat_activity.touch(chat_id, data["timestamp"])
+            chat_history.append(chat_id, message_id, from_name, text, is_project)
+            return result.data[0] if result.data else None
+
+        except Exception as e:
+            # Игнорируем дубликаты по thread_key
+            if "duplicate key value" in str(e).lower() or "23505" in str(e):
+                return None
+            logger.error(f"Error logging message: {e}")
+            return None
+
+    async def update_message_status(
+        self,
+        log_id: int,
+        status: str,
+        **kwargs: Any
+    ) -> bool:
+        """Обновляет статус сообщения."""
+        try:
+            data = {"status": status, **kwargs}
+            # Строка ещё в буфере — обновление уйдёт в БД вместе с ней
+            if self._log_buffer is not None and not await self._log_buffer.update([log_id], data):
+                return True
+            await self.client.table("chat_log").update(data).eq("id", log_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating message status: {e}")
+            return False
+
+    async def update_messages_status(
+        self,
+        log_ids: list[int],
+        status: str,
+        **kwargs: Any
+    ) -> bool:
+        """Обновляет статус сразу нескольких сообщений одним запросом."""
+        if not log_ids:
+            return True
+        try:
+            data = {"status": status, **kwargs}
+            if self._log_buffer is not None:
+                log_ids = await self._log_buffer.update(log_ids, data)
+                if not log_ids:
+                    return True
+            await self.client.table("chat_log").update(data).in_("id", log_ids).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating messages status: {e}")
+            return False
+
+    async def get_message_by_id(self, log_id: int) -> dict | None:
+        """Получает сообщение по ID (ещё не записанное — из буфера)."""
+        if self._log_buffer is not None:
+            row = self._log_buffer.get(log_id)
+            if row is not None:
+                return row
+        try:
+            result = await self.client.table("chat_log").select("*").eq("id", log_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error getting message: {e}")
+            return None
+
+    async def get_recent_messages(
+        self,
+        chat_id: str,
+        before_message_id: int,
+        limit: int = 5
+    ) -> list[dict] | None:
+        """
+        Получает последние сообщения из чата для контекста.
+
+        Returns:
+            list[dict] | None: Сообщения (старые первыми) или None при ошибке
+        """
+        try:
+            result = await (
+                self.client.table("chat_log")
+                .select("message_id, from_name, text, is_project, timestamp")
+                .eq("chat_id", chat_id)
+                .lt("message_id", before_message_id)
+                .order("message_id", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            messages = result.data or []
+            messages.reverse()  # Старые первыми
+            return messages
+        except Exception as e:
+            logger.error(f"Error getting recent messages: {e}")
+            return None
+
+    async def find_project_answer(
+        self,
+        chat_id: str,
+        after_message_id: int
+    ) -> dict | None:
+        """Ищет ответ проджекта после указанного сообщения."""
+        try:
+            result = await (
+                self.client.table("chat_log")
+                .select("*")
+                .eq("chat_id", chat_id)
+                .eq("is_project", True)
+                .gt("message_id", after_message_id)
+                .order("message_id", desc=False)
+                .limit(1)
+                .execute()
+            )
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error finding project answer: {e}")
+            return None
+
+    async def get_waiting_messages(self, page_size: int = 1000) -> list[dict]:
+        """
+        Получает все сообщения, ожидающие ответа (status='waiting').
+
+        Читает постранично по id (keyset, индекс idx_chat_log_waiting_id):
+        в отличие от offset, страницы не съезжают, когда записи выходят
+        из waiting во время чтения, и не повторяются на равных pending_until.
+
+        Returns:
+            list[dict]: Записи, отсортированные по pending_until (без срока — первыми)
+        """
+        rows: list[dict] = []
+        try:
+            last_id = 0
+            while True:
+                result = await (
+                    self.client.table("chat_log")
+                    .select("id, chat_id, message_id, pending_until, escalation_attempt")
+                    .eq("status", "waiting")
+                    .gt("id", last_id)
+                    .order("id")
+                    .limit(page_size)
+                    .execute()
+                )
+                page = result.data or []
+                rows.extend(page)
+                if len(page) < page_size:
+                    break
+                last_id = page[-1]["id"]
+        except Exception as e:
+            logger.error(f"Error getting waiting messages: {e}")
+
+        rows.sort(key=lambda row: (row.get("pending_until") is not None, row.get("pending_until") or ""))
+        return rows
+
+    async def get_due_waiting_messages(self, due_before: datetime, limit: int = 500) -> list[dict]:
+        """Получает сообщения со status='waiting', у которых наступил pending_until."""
+        try:
+            result = await (
+                self.client.table("chat_log")
+                .select("*")
+                .eq("status", "waiting")
+                .lte("pending_until", due_before.isoformat())
+                .order("pending_until")
+                .limit(limit)
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting due waiting messages: {e}")
+            return []
+
+    async def find_project_answers(
+        self,
+        threads: list[tuple[str, int]]
+    ) -> dict[tuple[str, int], dict] | None:
+        """
+        Ищет ответы проджектов сразу для многих сообщений.
+
+        Использует SQL-функцию find_project_answers (см. supabase_setup.sql),
+        не больше MAX_ROWS сообщений за запрос (по строке ответа на каждое).
+
+        Args:
+            threads: Пары (chat_id, message_id) сообщений клиентов
+
+        Returns:
+            dict | None: (chat_id, message_id) -> первый ответ проджекта после
+                         сообщения или None, если проверить не удалось
+        """
+        answers: dict[tuple[str, int], dict] = {}
+        try:
+            for i in range(0, len(threads), MAX_ROWS):
+                chunk = threads[i:i + MAX_ROWS]
+                result = await self.client.rpc("find_project_answers", {
+                    "p_chat_ids": [chat_id for chat_id, _ in chunk],
+                    "p_message_ids": [message_id for _, message_id in chunk],
+                }).execute()
+
+                for row in result.data or []:
+                    answers[(str(row["chat_id"]), int(row["after_message_id"]))] = row
+            return answers
+        except Exception as e:
+            logger.error(f"Error finding project answers: {e}")
+            return None
+
+    async def mark_messages_answered(self, answers: list[tuple[int, dict]]) -> bool:
+        """
+        Закрывает многие сообщения как отвеченные одним запросом на пачку.
+
+        Использует SQL-функцию mark_messages_answered (см. supabase_setup.sql).
+
+        Args:
+            answers: Пары (log_id, ответ проджекта из find_project_answers)
+
+        Returns:
+            bool: True, если записаны все пачки
+        """
+        try:
+            for i in range(0, len(answers), MAX_ROWS):
+                chunk = answers[i:i + MAX_ROWS]
+                await self.client.rpc("mark_messages_answered", {
+                    "p_ids": [log_id for log_id, _ in chunk],
+                    "p_answered_by": [answer.get("from_name") for _, answer in chunk],
+                    "p_answered_message_ids": [answer.get("message_id") for _, answer in chunk],
+                    "p_answered_texts": [answer.get("text") or "" for _, answer in chunk],
+                }).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error marking messages answered: {e}")
+            return False
+
+    async def get_last_activity(self, chat_ids: list[str]) -> dict[str, str] | None:
+        """
+        Получает время последнего сообщения сразу для многих чатов.
+
+        Использует SQL-функцию chat_last_activity (см. supabase_setup.sql),
+        не больше MAX_ROWS чатов за запрос.
+
+        Returns:
+            dict | None: chat_id -> timestamp последнего сообщения (чаты без
+                         сообщений отсутствуют) или None при ошибке
+        """
+        activity: dict[str, str] = {}
+        try:
+            for i in range(0, len(chat_ids), MAX_ROWS):
+                result = await self.client.rpc("chat_last_activity", {
+                    "p_chat_ids": chat_ids[i:i + MAX_ROWS],
+                }).execute()
+
+                for row in result.data or []:
+                    if row.get("last_message_at"):
+                        activity[str(row["chat_id"])] = row["last_message_at"]
+            return activity
+        except Exception as e:
+            logger.error(f"Error getting last activity: {e}")
+            return None
+
+    async def get_chat_activity(self, page_size: int = 1000) -> list[dict] | None:
+        """
+        Получает таблицу chat_activity (последнее сообщение по каждому чату).
+
+        Returns:
+            list[dict] | None: Все строки или None, если прочитать целиком не удалось
+        """
+        rows: list[dict] = []
+        try:
+            offset = 0
+            while True:
+                result = await (
+                    self.client.table("chat_activity")
+                    .select("chat_id, last_message_at")
+                    .order("chat_id")
+                    .range(offset, offset + page_size - 1)
+                    .execute()
+                )
+                page = result.data or []
+                rows.extend(page)
+                if len(page) < page_size:
+                    return rows
+                offset += page_size
+        except Exception as e:
+            logger.error(f"Error getting chat activity: {e}")
+            return None
+
+    async def get_recent_messages_for_chats(
+        self,
+        chat_ids: list[str],
+        limit: int = 20
+    ) -> dict[str, list[dict]] | None:
+        """
+        Получает последние сообщения сразу для многих чатов.
+
+        Использует SQL-функцию recent_messages_for_chats (см. supabase_setup.sql).
+        Чаты запрашиваются пачками так, чтобы ответ (limit строк на чат)
+        не превышал MAX_ROWS.
+
+        Returns:
+            dict | None: chat_id -> сообщения (старые первыми) или None при ошибке
+        """
+        histories: dict[str, list[dict]] = {}
+        chunk = max(1, MAX_ROWS // max(1, limit))
+        try:
+            for i in range(0, len(chat_ids), chunk):
+                result = await self.client.rpc("recent_messages_for_chats", {
+                    "p_chat_ids": chat_ids[i:i + chunk],
+                    "p_limit": limit,
+                }).execute()
+
+                for row in result.data or []:
+                    histories.setdefault(str(row["chat_id"]), []).append(row)
+
+            for messages in histories.values():
+                messages.sort(key=lambda m: m["message_id"])
+            return histories
+        except Exception as e:
+            logger.error(f"Error getting recent messages for chats: {e}")
+            return None
+
+    # ============ CHAT OWNERS ============
+
+    async def get_chat_owner(self, chat_id: str) -> dict | None:
+        """Получает владельца чата."""
+        try:
+            result = await (
+                self.client.table("chat_owners")
+                .select("*")
+                .eq("chat_id", chat_id)
+                .limit(1)
+                .execute()
+            )
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error getting chat owner: {e}")
+            return None
+
+    async def upsert_chat_owner(
+        self,
+        chat_id: str,
+        chat_name: str,
+        project_id: int,
+        project_name: str
+    ) -> bool:
+        """Создаёт или обновляет владельца чата (тот же владелец — без запросов к БД)."""
+        try:
+            payload = {
+                "chat_id": chat_id,
+                "chat_name": chat_name,
+                "project_id": project_id,
+                "project_name": project_name,
+                "assigned_at": datetime.now().isoformat(),
+            }
+
+            if chat_cache.owner_unchanged(chat_id, payload):
+                return True
+
+            existing = await self.get_chat_owner(chat_id)
+
+            if existing:
+                await self.client.table("chat_owners").update(payload).eq("chat_id", chat_id).execute()
+            else:
+                await self.client.table("chat_owners").insert(payload).execute()
+
+            chat_cache.set_owner(chat_id, payload)
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting chat owner: {e}")
+            return False
+
+    async def get_chat_owners(self, chat_ids: list[str]) -> dict[str, dict] | None:
+        """
+        Получает владельцев указанных чатов.
+
+        Чаты запрашиваются пачками по 200 — фильтр in.(...) идёт в URL.
+
+        Returns:
+            dict | None: chat_id -> владелец или None при ошибке
+        """
+        owners: dict[str, dict] = {}
+        try:
+            for i in range(0, len(chat_ids), 200):
+                result = await (
+                    self.client.table("chat_owners")
+                    .select("*")
+                    .in_("chat_id", chat_ids[i:i + 200])
+                    .execute()
+                )
+                for row in result.data or []:
+                    owners[str(row["chat_id"])] = row
+            return owners
+        except Exception as e:
+            logger.error(f"Error getting chat owners: {e}")
+            return None
+
+    async def get_all_chat_owners(self) -> list[dict]:
+        """Получает всех владельцев чатов."""
+        try:
+            result = await self.client.table("chat_owners").select("*").execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting all chat owners: {e}")
+            return []
+
+    # ============ DEALS ============
+
+    async def get_deal(self, deal_id: str) -> dict | None:
+        """Получает сделку по ID."""
+        try:
+            result = await self.client.table("deals").select("*").eq("deal_id", deal_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error getting deal: {e}")
+            return None
+
+    async def upsert_deal(self, deal_data: dict) -> bool:
+        """Создаёт или обновляет сделку."""
+        try:
+            existing = await self.get_deal(deal_data["deal_id"])
+
+            deal_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+            if existing:
+                await self.client.table("deals").update(deal_data).eq("deal_id", deal_data["deal_id"]).execute()
+            else:
+                deal_data["created_at"] = datetime.now(timezone.utc).isoformat()
+                await self.client.table("deals").insert(deal_data).execute()
+
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting deal: {e}")
+            return False
+
+    async def get_deals_by_chat(self, chat_id: str) -> list[dict]:
+        """Получает все сделки для чата."""
+        try:
+            result = await self.client.table("deals").select("*").eq("chat_id", chat_id).execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting deals by chat: {e}")
+            return []
+
+    async def delete_deal(self, deal_id: str) -> bool:
+        """Удаляет сделку."""
+        try:
+            await self.client.table("deals").delete().eq("deal_id", deal_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting deal: {e}")
+            return False
+
+    # ============ STAGE ACTIONS ============
+
+    async def get_stage_actions(self, stage_id: str, service_type: str) -> list[dict]:
+        """Получает действия для стадии."""
+        try:
+            result = await (
+                self.client.table("stage_actions")
+                .select("*")
+                .eq("stage_id", stage_id)
+                .eq("service_type", service_type)
+                .eq("is_active", True)
+                .order("priority")
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting stage actions: {e}")
+            return []
+
+    async def create_stage_action(self, action_data: dict) -> bool:
+        """Создаёт действие для стадии."""
+        try:
+            await self.client.table("stage_actions").insert(action_data).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error creating stage action: {e}")
+            return False
+
+    # ============ NPS QUEUE ============
+
+    async def add_to_nps_queue(self, nps_data: dict) -> bool:
+        """Добавляет запись в очередь NPS."""
+        try:
+            await self.client.table("nps_queue").insert(nps_data).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error adding to NPS queue: {e}")
+            return False
+
+    async def get_pending_nps(self) -> list[dict]:
+        """Получает NPS-записи готовые к отправке."""
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            result = await (
+                self.client.table("nps_queue")
+                .select("*")
+                .is_("sent_at", "null")
+                .lte("send_at", now)
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting pending NPS: {e}")
+            return []
+
+    async def mark_nps_sent(self, nps_id: int) -> bool:
+        """Помечает NPS как отправленный."""
+        try:
+            await self.client.table("nps_queue").update({
+                "sent_at": datetime.now(timezone.utc).isoformat()
+            }).eq("id", nps_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error marking NPS sent: {e}")
+            return False
+
+    # ============ DIGEST ============
+
+    async def get_messages_for_period(
+        self,
+        chat_id: str,
+        since: datetime,
+        until: datetime | None = None,
+        limit: int = 500
+    ) -> list[dict]:
+        """
+        Получает сообщения из чата за указанный период.
+
+        Args:
+            chat_id: ID чата
+            since: Начало периода (datetime с timezone)
+            until: Конец периода (если None — до текущего момента)
+            limit: Максимум сообщений
+
+        Returns:
+            Список сообщений, отсортированных по времени (старые первыми)
+        """
+        try:
+            query = (
+                self.client.table("chat_log")
+                .select("from_name, text, is_project, timestamp")
+                .eq("chat_id", chat_id)
+                .gte("timestamp", since.isoformat())
+            )
+
+            if until:
+                query = query.lte("timestamp", until.isoformat())
+
+            result = await (
+                query
+                .order("timestamp", desc=False)
+                .limit(limit)
+                .execute()
+            )
+
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting messages for period: {e}")
+            return []
+
+    # ============ UPSELL ============
+
+    async def get_upsell_run(self, period: str) -> dict | None:
+        """Получает запуск допродажи за период (YYYY-MM)."""
+        try:
+            result = await self.client.table("upsell_runs").select("*").eq("period", period).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error getting upsell run: {e}")
+            return None
+
+    async def save_upsell_run(self, period: str, status: str) -> bool:
+        """Создаёт или обновляет запуск допродажи (started / completed)."""
+        try:
+            data = {
+                "period": period,
+                "status": status,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            await self.client.table("upsell_runs").upsert(data, on_conflict="period").execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving upsell run: {e}")
+            return False
+
+    async def get_upsell_progress(self, period: str, page_size: int = 1000) -> dict[str, dict] | None:
+        """
+        Получает прогресс допродажи за период.
+
+        Returns:
+            dict | None: chat_id -> запись или None, если прочитать целиком не удалось
+        """
+        progress: dict[str, dict] = {}
+        try:
+            offset = 0
+            while True:
+                result = await (
+                    self.client.table("upsell_progress")
+                    .select("*")
+                    .eq("period", period)
+                    .order("chat_id")
+                    .range(offset, offset + page_size - 1)
+                    .execute()
+                )
+                page = result.data or []
+                progress.update({str(row["chat_id"]): row for row in page})
+                if len(page) < page_size:
+                    return progress
+                offset += page_size
+        except Exception as e:
+            logger.error(f"Error getting upsell progress: {e}")
+            return None
+
+    async def save_upsell_progress(self, period: str, chat_id: str, status: str, **kwargs) -> bool:
+        """Сохраняет этап допродажи для чата (generated / sent)."""
+        try:
+            data = {
+                "period": period,
+                "chat_id": chat_id,
+                "status": status,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **kwargs,
+            }
+            await self.client.table("upsell_progress").upsert(data, on_conflict="period,chat_id").execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving upsell progress: {e}")
+            return False
+
+    # ============ CLIENT KNOWLEDGE ============
+
+    async def get_client_knowledge(self, chat_id: str) -> dict | None:
+        """Получает базу знаний по клиенту (из кэша, если есть)."""
+        cached = chat_cache.get_knowledge(chat_id)
+        if cached is not MISSING:
+            return dict(cached) if cached else None
+
+        try:
+            result = await (
+                self.client.table("client_knowledge")
+                .select("*")
+                .eq("chat_id", chat_id)
+                .limit(1)
+                .execute()
+            )
+            row = result.data[0] if result.data else None
+            chat_cache.set_knowledge(chat_id, row)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting client knowledge: {e}")
+            return None
+
+    async def upsert_client_knowledge(self, chat_id: str, **kwargs) -> bool:
+        """Создаёт или обновляет базу знаний по клиенту."""
+        try:
+            existing = await self.get_client_knowledge(chat_id)
+
+            data = {"chat_id": chat_id, **kwargs}
+            data["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+            if existing:
+                await self.client.table("client_knowledge").update(data).eq("chat_id", chat_id).execute()
+            else:
+                data["created_at"] = datetime.now(timezone.utc).isoformat()
+                await self.client.table("client_knowledge").insert(data).execute()
+
+            chat_cache.update_knowledge(chat_id, data)
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting client knowledge: {e}")
+            return False
+
+    async def update_client_field(self, chat_id: str, field: str, value: str) -> bool:
+        """Обновляет одно поле базы знаний."""
+        return await self.upsert_client_knowledge(chat_id, **{field: value})
+
+    async def append_client_note(self, chat_id: str, note: str) -> bool:
+        """Добавляет заметку к существующим."""
+        try:
+            existing = await self.get_client_knowledge(chat_id)
+            current_notes = existing.get("notes", "") if existing else ""
+
+            if current_notes:
+                new_notes = f"{current_notes}\n---\n{note}"
+            else:
+                new_notes = note
+
+            return await self.upsert_client_knowledge(chat_id, notes=new_notes)
+        except Exception as e:
+            logger.error(f"Error appending client note: {e}")
+            return False
+
+    # ============ REMINDERS ============
+
+    async def create_reminder(
+        self,
+        chat_id: str,
+        chat_name: str,
+        project_id: int,
+        reminder_text: str,
+        remind_at: datetime,
+        context: str = None,
+        source_message_id: int = None
+    ) -> dict | None:
+        """Создаёт напоминание."""
+        try:
+            data = {
+                "chat_id": chat_id,
+                "chat_name": chat_name,
+                "project_id": project_id,
+                "reminder_text": reminder_text,
+                "remind_at": remind_at.isoformat(),
+                "context": context,
+                "source_message_id": source_message_id,
+                "status": "pending",
+            }
+            result = await self.client.table("reminders").insert(data).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error creating reminder: {e}")
+            return None
+
+    async def get_pending_reminders(self, before: datetime = None) -> list[dict]:
+        """Получает напоминания, которые пора отправить."""
+        try:
+            if before is None:
+                before = datetime.now(timezone.utc)
+
+            result = await (
+                self.client.table("reminders")
+                .select("*")
+                .eq("status", "pending")
+                .lte("remind_at", before.isoformat())
+                .order("remind_at")
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting pending reminders: {e}")
+            return []
+
+    async def mark_reminder_sent(self, reminder_id: int) -> bool:
+        """Отмечает напоминание как отправленное."""
+        try:
+            await self.client.table("reminders").update({
+                "status": "sent",
+                "sent_at": datetime.now(timezone.utc).isoformat()
+            }).eq("id", reminder_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error marking reminder sent: {e}")
+            return False
+
+    async def get_reminders_for_project(self, project_id: int, status: str = "pending") -> list[dict]:
+        """Получает напоминания для проджекта."""
+        try:
+            result = await (
+                self.client.table("reminders")
+                .select("*")
+                .eq("project_id", project_id)
+                .eq("status", status)
+                .order("remind_at")
+                .execute()
+            )
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting reminders for project: {e}")
+            return []
+
+    async def cancel_reminder(self, reminder_id: int) -> bool:
+        """Отменяет напоминание."""
+        try:
+            await self.client.table("reminders").update({
+                "status": "cancelled"
+            }).eq("id", reminder_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error cancelling reminder: {e}")
+            return False
+
+
+# Глобальный экземпляр
+async_db = AsyncDatabase()
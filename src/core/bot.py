@@ -1,12 +1,16 @@
 """
 Инициализация Telegram бота.
 
-Bot и Dispatcher для aiogram.
+Bot и Dispatcher для aiogram, отправка с ограничением частоты.
 """
 
+import asyncio
+
 from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter
 
 from src.config import settings
+from src.utils.rate_limit import RateLimiter
 
 
 # Telegram бот
@@ -14,3 +18,20 @@ bot = Bot(token=settings.telegram_token)
 
 # Диспетчер
 dp = Dispatcher()
+
+# Общий лимит на исходящие сообщения (Telegram: ~30 сообщений/сек)
+telegram_limiter = RateLimiter(settings.telegram_rate_limit)
+
+
+async def send_message_throttled(chat_id: int | str, text: str, **kwargs):
+    """
+    Отправляет сообщение с учётом лимитов Telegram.
+
+    При ответе 429 (RetryAfter) ждёт указанное время и повторяет один раз.
+    """
+    await telegram_limiter.wait()
+    try:
+        return await bot.send_message(chat_id, text, **kwargs)
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await bot.send_message(chat_id, text, **kwargs)
@@ -0,0 +1,57 @@
+"""
+Последняя активность по чатам.
+
+Компактная карта chat_id -> время последнего сообщения в памяти.
+Обновляется из Database.log_message, при старте загружается
+из таблицы chat_activity (её ведёт триггер на chat_log).
+"""
+
+from datetime import datetime
+
+from src.utils.logging import get_logger
+from src.utils.time_utils import parse_timestamp
+
+
+logger = get_logger(__name__)
+
+
+class ChatActivity:
+    """Карта последней активности чатов."""
+
+    def __init__(self):
+        self._last: dict[str, datetime] = {}
+        self.loaded = False
+
+    def touch(self, chat_id: str, timestamp: str | datetime) -> None:
+        """Отмечает новое сообщение в чате."""
+        if isinstance(timestamp, str):
+            timestamp = parse_timestamp(timestamp)
+        current = self._last.get(str(chat_id))
+        if current is None or timestamp > current:
+            self._last[str(chat_id)] = timestamp
+
+    def get(self, chat_id: str) -> datetime | None:
+        """Время последнего сообщения в чате или None."""
+        return self._last.get(str(chat_id))
+
+    def load(self, rows: list[dict] | None) -> None:
+        """
+        Загружает карту из строк таблицы chat_activity.
+
+        Args:
+            rows: Все строки таблицы или None, если чтение не удалось —
+                  тогда карта остаётся незагруженной и проверки идут в БД
+        """
+        if rows is None:
+            logger.warning("Активность по чатам не загружена, проверки пойдут в БД")
+            return
+
+        for row in rows:
+            if row.get("chat_id") and row.get("last_message_at"):
+                self.touch(row["chat_id"], row["last_message_at"])
+        self.loaded = True
+        logger.info(f"Загружена активность по {len(self._last)} чатам")
+
+
+# Глобальный экземпляр
+chat_activity = ChatActivity()
@@ -0,0 +1,79 @@
+"""
+Кэш владельцев чатов и базы знаний по клиентам.
+
+Владелец чата меняется редко, а upsert_chat_owner вызывается на каждое
+сообщение проджекта. Повторная запись того же владельца пропускается, но
+не дольше owner_ttl — потом она выполняется, как раньше, и обновляет
+assigned_at.
+
+База знаний читается при анализе каждого сообщения проджекта и держится
+в памяти с TTL: её правят и извне, например через дашборд. Кэш
+обновляется из Database и AsyncDatabase.
+"""
+
+import time
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Признак промаха: None — тоже валидное значение (записи нет в БД)
+MISSING = object()
+
+# Поля chat_owners, по которым сравнивается владелец
+OWNER_FIELDS = ("chat_name", "project_id", "project_name")
+
+
+class ChatCache:
+    """Владельцы чатов и база знаний по клиентам в памяти."""
+
+    def __init__(self, owner_ttl: int = 600, knowledge_ttl: int = 600):
+        self.owner_ttl = owner_ttl
+        self.knowledge_ttl = knowledge_ttl
+        self._owners: dict[str, tuple[float, dict]] = {}
+        self._knowledge: dict[str, tuple[float, dict | None]] = {}
+
+    # ============ CHAT OWNERS ============
+
+    def owner_unchanged(self, chat_id: str, owner: dict) -> bool:
+        """True, если в кэше тот же владелец и он записан недавно — запись в БД не нужна."""
+        entry = self._owners.get(str(chat_id))
+        if entry is None or entry[0] < time.monotonic():
+            return False
+        cached = entry[1]
+        return all(str(cached.get(f)) == str(owner.get(f)) for f in OWNER_FIELDS)
+
+    def set_owner(self, chat_id: str, owner: dict | None) -> None:
+        """Запоминает владельца чата (None — забыть)."""
+        if owner is None:
+            self._owners.pop(str(chat_id), None)
+        else:
+            self._owners[str(chat_id)] = (
+                time.monotonic() + self.owner_ttl,
+                {f: owner.get(f) for f in OWNER_FIELDS},
+            )
+
+    # ============ CLIENT KNOWLEDGE ============
+
+    def get_knowledge(self, chat_id: str):
+        """Запись базы знаний, None если её нет в БД, или MISSING."""
+        entry = self._knowledge.get(str(chat_id))
+        if entry is None or entry[0] < time.monotonic():
+            return MISSING
+        return entry[1]
+
+    def set_knowledge(self, chat_id: str, row: dict | None) -> None:
+        """Запоминает запись базы знаний (в т.ч. её отсутствие)."""
+        self._knowledge[str(chat_id)] = (time.monotonic() + self.knowledge_ttl, row)
+
+    def update_knowledge(self, chat_id: str, fields: dict) -> None:
+        """Дописывает поля в закэшированную запись после upsert."""
+        row = self.get_knowledge(chat_id)
+        if row is MISSING:
+            return
+        self.set_knowledge(chat_id, {**(row or {"chat_id": str(chat_id)}), **fields})
+
+
+# Глобальный экземпляр
+chat_cache = ChatCache()
@@ -0,0 +1,147 @@
+"""
+Последние сообщения по активным чатам.
+
+Кольцевой буфер на N сообщений для каждого чата: контекст для GPT
+собирается из памяти, без запроса к chat_log. Буфер пополняется
+из log_message, недостающую историю один раз подгружает БД (seed).
+Давно молчащие чаты и лишние сверх лимита вытесняются (LRU).
+"""
+
+import time
+from collections import OrderedDict, deque
+
+from src.config import settings
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Сколько символов текста хранить — для контекста GPT больше не нужно
+MAX_TEXT_CHARS = 500
+
+
+class _ChatBuffer:
+    """Сообщения одного чата: (message_id, is_project, from_name, text)."""
+
+    __slots__ = ("messages", "complete", "last_used")
+
+    def __init__(self, size: int):
+        self.messages: deque[tuple[int, bool, str, str]] = deque(maxlen=size)
+        # True — в буфере вся история чата (старше сообщений нет)
+        self.complete = False
+        self.last_used = time.monotonic()
+
+
+class ChatHistory:
+    """Кольцевые буферы последних сообщений по чатам."""
+
+    def __init__(self, size: int, max_chats: int, idle_seconds: int):
+        self.size = size
+        self.max_chats = max_chats
+        self.idle_seconds = idle_seconds
+        self._chats: OrderedDict[str, _ChatBuffer] = OrderedDict()
+
+    def _buffer(self, chat_id: str, create: bool = False) -> _ChatBuffer | None:
+        """Буфер чата с отметкой использования (LRU)."""
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            if not create:
+                return None
+            buffer = self._chats[chat_id] = _ChatBuffer(self.size)
+            self._evict()
+        buffer.last_used = time.monotonic()
+        self._chats.move_to_end(chat_id)
+        return buffer
+
+    def _evict(self) -> None:
+        """Вытесняет чаты сверх лимита и давно неактивные."""
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+        idle_before = time.monotonic() - self.idle_seconds
+        while self._chats:
+            chat_id, buffer = next(iter(self._chats.items()))
+            if buffer.last_used >= idle_before:
+                break
+            del self._chats[chat_id]
+
+    def append(self, chat_id: str, message_id: int, from_name: str, text: str, is_project: bool) -> None:
+        """Добавляет новое сообщение чата."""
+        if self.size <= 0:
+            return
+
+        buffer = self._buffer(str(chat_id), create=True)
+        item = (int(message_id), bool(is_project), from_name or "", (text or "")[:MAX_TEXT_CHARS])
+        messages = buffer.messages
+
+        if len(messages) == messages.maxlen:
+            buffer.complete = False
+
+        if not messages or messages[-1][0] < item[0]:
+            messages.append(item)
+        else:
+            # Сообщения пришли не по порядку — вставляем на своё место
+            items = {m[0]: m for m in messages}
+            items[item[0]] = item
+            buffer.messages = deque(sorted(items.values())[-self.size:], maxlen=self.size)
+
+    def get_before(self, chat_id: str, before_message_id: int, limit: int) -> list[dict] | None:
+        """
+        Последние limit сообщений до before_message_id (старые первыми).
+
+        Returns:
+            list[dict] | None: Сообщения в формате get_recent_messages
+                               или None, если в буфере их недостаточно
+        """
+        buffer = self._buffer(str(chat_id))
+        if buffer is None:
+            return None
+
+        earlier = [m for m in buffer.messages if m[0] < before_message_id]
+        if len(earlier) < limit and not buffer.complete:
+            return None
+
+        return [
+            {"message_id": m[0], "is_project": m[1], "from_name": m[2], "text": m[3]}
+            for m in earlier[-limit:]
+        ] if limit > 0 else []
+
+    def seed(self, chat_id: str, before_message_id: int, rows: list[dict], limit: int) -> None:
+        """
+        Дополняет буфер историей из БД (последние limit сообщений до before_message_id).
+
+        Буфер должен доходить до before_message_id без разрывов, иначе
+        история из БД с ним не стыкуется и не сохраняется.
+        """
+        buffer = self._buffer(str(chat_id))
+        if buffer is None or not buffer.messages or buffer.messages[0][0] > before_message_id:
+            return
+
+        items = {
+            int(row["message_id"]): (
+                int(row["message_id"]),
+                bool(row.get("is_project")),
+                row.get("from_name") or "",
+                (row.get("text") or "")[:MAX_TEXT_CHARS],
+            )
+            for row in rows
+            if row.get("message_id") is not None
+        }
+        for m in buffer.messages:
+            if m[0] >= before_message_id:
+                items[m[0]] = m
+
+        merged = sorted(items.values())
+        buffer.messages = deque(merged[-self.size:], maxlen=self.size)
+        buffer.complete = len(rows) < limit and len(merged) <= self.size
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+
+# Глобальный экземпляр
+chat_history = ChatHistory(
+    size=settings.chat_history_size,
+    max_chats=settings.chat_history_max_chats,
+    idle_seconds=settings.chat_history_idle_hours * 3600,
+)
@@ -0,0 +1,256 @@
+"""
+Отложенная пакетная запись chat_log (write-behind).
+
+Сообщение получает id и thread_key сразу, в памяти, и обработчик идёт
+дальше, не дожидаясь БД. Строки уходят в БД пачками — по размеру
+(CHAT_LOG_FLUSH_SIZE) или по таймеру (CHAT_LOG_FLUSH_INTERVAL_MS).
+id заранее резервируются блоками из последовательности chat_log.
+
+Дубли thread_key отсекаются по памяти: очередь плюс недавно записанные
+ключи (при первом обращении подгружаются из БД — повторная доставка
+после рестарта тоже отсекается). Обновления статуса ещё не записанных
+строк сливаются в саму строку. Пачка, которая не записалась
+max_attempts раз, пишется по одной строке. close() в AsyncDatabase
+дожидается сброса буфера при остановке бота.
+"""
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class ChatLogBufferFull(Exception):
+    """Буфер переполнен — строку нужно писать напрямую."""
+
+
+class ChatLogBuffer:
+    """Буфер строк chat_log с пакетной записью."""
+
+    def __init__(
+        self,
+        write_rows: Callable[[list[dict]], Awaitable[list[dict]]],
+        reserve_ids: Callable[[int], Awaitable[list[int]]],
+        load_recent_keys: Callable[[], Awaitable[list[str]]],
+        flush_size: int,
+        flush_interval_ms: int,
+        id_block: int = 100,
+        max_attempts: int = 3,
+        max_pending: int = 1000,
+        dedup_size: int = 10000,
+    ):
+        """
+        Args:
+            write_rows: Пакетная вставка, возвращает реально вставленные строки
+            reserve_ids: Резервирует блок id chat_log
+            load_recent_keys: thread_key последних записанных сообщений
+            flush_size: Размер пачки, при котором запись начинается сразу
+            flush_interval_ms: Сколько строка может ждать в очереди
+            id_block: Сколько id резервировать за раз
+            max_attempts: Попыток записать пачку до записи по одной строке
+            max_pending: Предел очереди — сверх него строки пишутся напрямую
+            dedup_size: Сколько недавно записанных thread_key помнить
+        """
+        self._write_rows = write_rows
+        self._reserve_ids = reserve_ids
+        self._load_recent_keys = load_recent_keys
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = max(0, flush_interval_ms) / 1000
+        self.id_block = max(1, id_block)
+        self.max_attempts = max(1, max_attempts)
+        self.max_pending = max(self.flush_size, max_pending)
+
+        self._ids: deque[int] = deque()
+        self._reserve_lock = asyncio.Lock()
+        self._pending: dict[int, dict] = {}
+        self._inflight: dict[int, dict] = {}
+        self._attempts: dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._timer: asyncio.Task | None = None
+
+        # thread_key в очереди и недавно записанные
+        self._keys: set[str] = set()
+        self._written: deque[str] = deque()
+        self.dedup_size = dedup_size
+        self._keys_loaded = False
+
+    async def _prepare(self) -> None:
+        """Подгружает недавние thread_key и резервирует id (под одним локом)."""
+        async with self._reserve_lock:
+            if not self._keys_loaded:
+                for key in await self._load_recent_keys():
+                    self._remember_written(key)
+                self._keys_loaded = True
+            if not self._ids:
+                self._ids.extend(await self._reserve_ids(self.id_block))
+
+    def _remember_written(self, thread_key: str) -> None:
+        if len(self._written) >= self.dedup_size:
+            self._keys.discard(self._written.popleft())
+        self._written.append(thread_key)
+        self._keys.add(thread_key)
+
+    async def add(self, row: dict) -> dict | None:
+        """
+        Ставит строку в очередь и сразу возвращает её с присвоенным id.
+
+        Args:
+            row: Строка chat_log без id (с thread_key)
+
+        Returns:
+            dict | None: Строка с id или None для дубликата
+
+        Raises:
+            ChatLogBufferFull: Очередь переполнена
+        """
+        if row["thread_key"] in self._keys:
+            return None
+        if len(self) >= self.max_pending:
+            raise ChatLogBufferFull(f"{len(self)} строк в очереди")
+
+        if not self._keys_loaded or not self._ids:
+            await self._prepare()
+        # Пока ждали БД, тот же ключ мог прийти повторно
+        if row["thread_key"] in self._keys:
+            return None
+
+        row = {**row, "id": self._ids.popleft()}
+        self._keys.add(row["thread_key"])
+        self._pending[row["id"]] = row
+
+        if len(self._pending) >= self.flush_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return dict(row)
+
+    def get(self, log_id: int) -> dict | None:
+        """Ещё не записанная строка по id."""
+        row = self._pending.get(log_id) or self._inflight.get(log_id)
+        return dict(row) if row else None
+
+    async def update(self, log_ids: list[int], data: dict) -> list[int]:
+        """
+        Применяет обновление к строкам в очереди.
+
+        Returns:
+            list[int]: id, которые нужно обновить в БД (уже записанные
+                       или записанные, пока ждали текущую пачку)
+        """
+        remaining = self._merge(log_ids, data)
+
+        # Строка уже уходит в БД — дождёмся вставки, потом обновим
+        if any(log_id in self._inflight for log_id in remaining):
+            async with self._flush_lock:
+                pass
+            # Пачка могла не записаться и вернуться в очередь
+            remaining = self._merge(remaining, data)
+
+        return remaining
+
+    def _merge(self, log_ids: list[int], data: dict) -> list[int]:
+        """Сливает data в строки очереди, возвращает id вне очереди."""
+        remaining = []
+        for log_id in log_ids:
+            if log_id in self._pending:
+                self._pending[log_id].update(data)
+            else:
+                remaining.append(log_id)
+        return remaining
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        self._start_flush()
+
+    async def flush(self) -> None:
+        """Записывает накопленное в БД (неудачная пачка остаётся в очереди)."""
+        async with self._flush_lock:
+            while self._pending:
+                self._inflight, self._pending = self._pending, {}
+                try:
+                    await self._write(list(self._inflight.values()))
+                except Exception as e:
+                    if not await self._handle_failure(e):
+                        return
+                finally:
+                    self._inflight = {}
+
+    async def drain(self) -> None:
+        """Сбрасывает буфер целиком — для остановки бота."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            await self.flush()
+
+    async def _write(self, rows: list[dict]) -> None:
+        """Пишет пачку и запоминает записанные ключи."""
+        # Строки с разными обновлениями статуса — разные наборы полей,
+        # а в одном запросе PostgREST набор полей должен совпадать
+        groups: dict[tuple, list[dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        for group in groups.values():
+            written = await self._write_rows(group)
+            self._done(group, written)
+            for row in group:
+                self._inflight.pop(row["id"], None)
+
+    def _done(self, rows: list[dict], written: list[dict]) -> None:
+        inserted = {r["thread_key"] for r in written or []}
+        for row in rows:
+            self._attempts.pop(row["id"], None)
+            self._keys.discard(row["thread_key"])
+            self._remember_written(row["thread_key"])
+            if row["thread_key"] not in inserted:
+                logger.warning(f"chat_log: {row['thread_key']} уже в БД, строка id={row['id']} пропущена")
+        logger.info(f"chat_log: записано пачкой {len(inserted)} из {len(rows)} строк")
+
+    async def _handle_failure(self, error: Exception) -> bool:
+        """
+        Неудачная пачка: вернуть в очередь или, после max_attempts, записать по одной.
+
+        Returns:
+            bool: True — пачка разобрана, можно писать дальше
+        """
+        batch = self._inflight
+        attempts = max(self._attempts.get(log_id, 0) for log_id in batch) + 1
+
+        if attempts < self.max_attempts:
+            logger.error(f"Ошибка пакетной записи chat_log ({len(batch)} строк, попытка {attempts}): {error}")
+            for log_id in batch:
+                self._attempts[log_id] = attempts
+            self._pending = {**batch, **self._pending}
+            if self._timer is None:
+                self._timer = asyncio.create_task(self._flush_later())
+            return False
+
+        # Одна «плохая» строка не должна держать остальные
+        logger.error(f"Ошибка пакетной записи chat_log ({len(batch)} строк), пишем по одной: {error}")
+        for row in list(batch.values()):
+            try:
+                self._done([row], await self._write_rows([row]))
+            except Exception as e:
+                self._attempts.pop(row["id"], None)
+                self._keys.discard(row["thread_key"])
+                logger.error(f"chat_log: строка {row['thread_key']} (id={row['id']}) не записана: {e}")
+            batch.pop(row["id"], None)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._inflight)
@@ -10,6 +10,9 @@ from typing import Any
 from supabase import create_client, Client
 
 from src.config import settings
+from src.core.chat_activity import chat_activity
+from src.core.chat_cache import MISSING, chat_cache
+from src.core.chat_history import chat_history
 from src.utils.logging import get_logger
 
 
@@ -65,6 +68,8 @@ class Database:
             }
 
             result = self.client.table("chat_log").insert(data).execute()
+            chat_activity.touch(chat_id, data["timestamp"])
+            chat_history.append(chat_id, message_id, from_name, text, is_project)
             return result.data[0] if result.data else None
 
         except Exception as e:
@@ -108,7 +113,7 @@ class Database:
         try:
             result = (
                 self.client.table("chat_log")
-                .select("from_name, text, is_project, timestamp")
+                .select("message_id, from_name, text, is_project, timestamp")
                 .eq("chat_id", chat_id)
                 .lt("message_id", before_message_id)
                 .order("message_id", desc=True)
@@ -168,10 +173,8 @@ class Database:
         project_id: int,
         project_name: str
     ) -> bool:
-        """Создаёт или обновляет владельца чата."""
+        """Создаёт или обновляет владельца чата (тот же владелец — без запросов к БД)."""
         try:
-            existing = self.get_chat_owner(chat_id)
-
             payload = {
                 "chat_id": chat_id,
                 "chat_name": chat_name,
@@ -180,11 +183,17 @@ class Database:
                 "assigned_at": datetime.now().isoformat(),
             }
 
+            if chat_cache.owner_unchanged(chat_id, payload):
+                return True
+
+            existing = self.get_chat_owner(chat_id)
+
             if existing:
                 self.client.table("chat_owners").update(payload).eq("chat_id", chat_id).execute()
             else:
                 self.client.table("chat_owners").insert(payload).execute()
 
+            chat_cache.set_owner(chat_id, payload)
             return True
         except Exception as e:
             logger.error(f"Error upserting chat owner: {e}")
@@ -359,7 +368,11 @@ class Database:
     # ============ CLIENT KNOWLEDGE ============
 
     def get_client_knowledge(self, chat_id: str) -> dict | None:
-        """Получает базу знаний по клиенту."""
+        """Получает базу знаний по клиенту (из кэша, если есть)."""
+        cached = chat_cache.get_knowledge(chat_id)
+        if cached is not MISSING:
+            return dict(cached) if cached else None
+
         try:
             result = (
                 self.client.table("client_knowledge")
@@ -368,7 +381,9 @@ class Database:
                 .limit(1)
                 .execute()
             )
-            return result.data[0] if result.data else None
+            row = result.data[0] if result.data else None
+            chat_cache.set_knowledge(chat_id, row)
+            return dict(row) if row else None
         except Exception as e:
             logger.error(f"Error getting client knowledge: {e}")
             return None
@@ -387,6 +402,7 @@ class Database:
                 data["created_at"] = datetime.now(timezone.utc).isoformat()
                 self.client.table("client_knowledge").insert(data).execute()
 
+            chat_cache.update_knowledge(chat_id, data)
             return True
         except Exception as e:
             logger.error(f"Error upserting client knowledge: {e}")
@@ -16,6 +16,7 @@
 - /dashboard — ссылка на дашборд (в личке)
 - /task — создать задачу в Битрикс24
 - /meeting — саммари встречи из видео/аудио (в личке)
+- /metrics — эффективность фильтров и кэшей GPT (владелец, в личке)
 """
 
 from datetime import datetime, timezone, timedelta
@@ -878,6 +879,37 @@ async def callback_back_clients(callback: CallbackQuery):
     )
 
 
+# ============ МЕТРИКИ ============
+
+@router.message(Command("metrics"), F.chat.type == "private")
+async def cmd_metrics(message: types.Message):
+    """/metrics — сколько классификаций обошлись без GPT (только владелец)."""
+    if message.from_user.id != settings.owner_id:
+        return
+
+    from src.services.need_answer_prefilter import need_answer_prefilter
+    from src.services.response_cache import response_cache
+
+    prefilter = need_answer_prefilter.stats()
+    cache = response_cache.stats()
+
+    await message.answer(
+        "📈 *Метрики классификации*\n\n"
+        "*Префильтр «нужен ли ответ»:*\n"
+        f"• Сообщений: {prefilter['total']}\n"
+        f"• Без ответа (правила): {prefilter['no_answer']}\n"
+        f"• Нужен ответ (правила): {prefilter['answer']}\n"
+        f"• Ушло в GPT: {prefilter['to_gpt']}\n"
+        f"• Решено без GPT: {prefilter['hit_rate']:.0%}\n\n"
+        "*Кэш ответов GPT:*\n"
+        f"• Записей: {cache['size']}\n"
+        f"• Попаданий: {cache['hits']}\n"
+        f"• Промахов: {cache['misses']}\n"
+        f"• Hit rate: {cache['hit_rate']:.0%}",
+        parse_mode="Markdown"
+    )
+
+
 # ============ НАПОМИНАНИЯ ============
 
 @router.message(Command("reminders"))
@@ -1650,6 +1682,9 @@ async def callback_task_from_commitment(callback: CallbackQuery):
 # Временное хранилище для ожидания файлов (user_id -> context)
 _pending_meeting_files: dict = {}
 
+# Задачи из саммари встречи, ожидающие создания в Битрикс24 (user_id -> data)
+_pending_meeting_tasks: dict = {}
+
 
 @router.message(Command("meeting"), F.chat.type == "private")
 async def cmd_meeting(message: types.Message, command: CommandObject):
@@ -1818,9 +1853,11 @@ async def _process_meeting_file(
     is_document: bool = False
 ):
     """Обрабатывает файл встречи: скачивает, транскрибирует, генерирует саммари."""
+    import asyncio
     import os
     import tempfile
 
+    from src.services.transcript_cache import transcript_cache
     from src.services.whisper_service import whisper_service
 
     # Определяем файл для скачивания
@@ -1861,34 +1898,65 @@ async def _process_meeting_file(
     file_path = os.path.join(temp_dir, f"meeting.{file_ext}")
 
     try:
-        # 1. Скачиваем файл
-        await bot.download(file, destination=file_path)
+        # Повторно присланный файл — транскрипция уже есть, не скачиваем
+        transcript = transcript_cache.get(file_unique_id=file.file_unique_id)
+        complete = True
 
-        await status_msg.edit_text(
-            "⏳ *Обрабатываю файл...*\n\n"
-            "1️⃣ ✅ Файл скачан\n"
-            "2️⃣ Транскрибирую аудио...\n\n"
-            f"📁 Размер: {file_size_mb:.1f} МБ",
-            parse_mode="Markdown"
-        )
+        if transcript is None:
+            # 1. Скачиваем файл
+            await bot.download(file, destination=file_path)
 
-        # 2. Транскрибируем
-        transcript = await whisper_service.transcribe(file_path, is_video=is_video)
+            content_hash = await asyncio.to_thread(transcript_cache.file_hash, file_path)
+            transcript = transcript_cache.get(content_hash=content_hash)
 
-        if not transcript:
-            await status_msg.edit_text(
-                "❌ Не удалось транскрибировать файл.\n\n"
-                "Возможные причины:\n"
-                "• Файл повреждён\n"
-                "• Нет речи в записи\n"
-                "• Проблема с FFmpeg на сервере"
-            )
-            return
+            if transcript is not None:
+                transcript_cache.link(file.file_unique_id, content_hash)
+            else:
+                await status_msg.edit_text(
+                    "⏳ *Обрабатываю файл...*\n\n"
+                    "1️⃣ ✅ Файл скачан\n"
+                    "2️⃣ Транскрибирую аудио...\n\n"
+                    f"📁 Размер: {file_size_mb:.1f} МБ",
+                    parse_mode="Markdown"
+                )
+
+                # 2. Транскрибируем: части уходят в Whisper по мере нарезки
+                async def on_progress(done: int, total: int | None):
+                    total_text = f"/{total}" if total else ""
+                    try:
+                        await status_msg.edit_text(
+                            "⏳ *Обрабатываю файл...*\n\n"
+                            "1️⃣ ✅ Файл скачан\n"
+                            f"2️⃣ Транскрибирую аудио... {done}{total_text}\n\n"
+                            f"📁 Размер: {file_size_mb:.1f} МБ",
+                            parse_mode="Markdown"
+                        )
+                    except Exception:
+                        # Telegram не даёт править сообщение слишком часто — не критично
+                        pass
+
+                transcript, complete = await whisper_service.transcribe_stream(
+                    file_path, is_video=is_video, on_progress=on_progress
+                )
+
+                if not transcript:
+                    await status_msg.edit_text(
+                        "❌ Не удалось транскрибировать файл.\n\n"
+                        "Возможные причины:\n"
+                        "• Файл повреждён\n"
+                        "• Нет речи в записи\n"
+                        "• Проблема с FFmpeg на сервере"
+                    )
+                    return
+
+                # Неполную транскрипцию не кэшируем — при повторе части распознаются заново
+                if complete:
+                    transcript_cache.put(transcript, content_hash, file.file_unique_id)
 
         await status_msg.edit_text(
             "⏳ *Обрабатываю файл...*\n\n"
             "1️⃣ ✅ Файл скачан\n"
-            "2️⃣ ✅ Транскрибировано\n"
+            f"2️⃣ {'✅ Транскрибировано' if complete else '⚠️ Транскрибировано частично'}\n"
             "3️⃣ Генерирую саммари...\n\n"
             f"📝 Текст: {len(transcript)} символов",
             parse_mode="Markdown"
@@ -1903,6 +1971,9 @@ async def _process_meeting_file(
         if context:
             result_parts.append(f"📋 _{context}_\n")
 
+        if not complete:
+            result_parts.append("⚠️ _Часть записи не распознана — саммари может быть неполным_\n")
+
         result_parts.append(f"\n📝 *Резюме:*\n{summary.get('summary', 'Нет данных')}\n")
 
         if summary.get("key_points"):
@@ -1944,6 +2015,22 @@ async def _process_meeting_file(
         else:
             await status_msg.edit_text(result_text, parse_mode="Markdown")
 
+        # Предлагаем завести задачи из встречи в Битрикс24
+        if summary.get("tasks") and settings.bitrix_webhook_url:
+            tasks = summary["tasks"][:10]
+            _pending_meeting_tasks[message.from_user.id] = {
+                "tasks": tasks,
+                "context": context,
+            }
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(
+                    text=f"📌 Создать задачи в Битрикс24 ({len(tasks)})",
+                    callback_data="meeting_tasks:create"
+                )],
+                [InlineKeyboardButton(text="❌ Не нужно", callback_data="meeting_tasks:cancel")],
+            ])
+            await message.answer("Завести задачи из встречи в Битрикс24?", reply_markup=keyboard)
+
         # Опционально: отправляем полную транскрипцию как файл
         if len(transcript) > 500:
             transcript_path = os.path.join(temp_dir, "transcript.txt")
@@ -1972,3 +2059,71 @@ async def _process_meeting_file(
             shutil.rmtree(temp_dir)
         except Exception:
             pass
+
+
+@router.callback_query(F.data.startswith("meeting_tasks:"))
+async def callback_meeting_tasks(callback: CallbackQuery):
+    """Создание в Битрикс24 всех задач из саммари встречи одним batch-запросом."""
+    user_id = callback.from_user.id
+    action = callback.data.split(":")[1]
+
+    data = _pending_meeting_tasks.pop(user_id, None)
+
+    if action == "cancel":
+        await callback.answer("Отменено")
+        await callback.message.edit_text("Хорошо, задачи не создаю.")
+        return
+
+    if not data:
+        await callback.answer("Задачи не найдены", show_alert=True)
+        return
+
+    await callback.answer()
+    await callback.message.edit_text("⏳ Создаю задачи в Битрикс24...")
+
+    # Пользователи для поиска ответственных — одним запросом вместе с группами
+    await bitrix_service.warm_cache()
+
+    creator_id = settings.telegram_to_bitrix.get(user_id, 1)
+    description_prefix = f"Из встречи: {data['context']}\n" if data.get("context") else "Из саммари встречи\n"
+
+    task_params = []
+    for task in data["tasks"]:
+        responsible_id = creator_id
+        assignee = task.get("assignee")
+        if assignee:
+            user = await bitrix_service.get_user_by_name(assignee)
+            if user:
+                responsible_id = user["id"]
+
+        description = description_prefix
+        if assignee:
+            description += f"Ответственный по встрече: {assignee}\n"
+        if task.get("deadline"):
+            description += f"Срок: {task['deadline']}\n"
+
+        task_params.append({
+            "title": (task.get("text") or "Задача из встречи")[:250],
+            "description": description,
+            "responsible_id": responsible_id,
+            "creator_id": creator_id,
+        })
+
+    created = await bitrix_service.create_tasks(task_params)
+
+    # Без parse_mode: названия задач от GPT могут содержать _ * [ ] и сломать
+    # разметку — тогда задачи уже созданы, а ответ так и не дошёл бы
+    bitrix_domain = settings.bitrix_webhook_url.split("/rest/")[0]
+    lines = []
+    for params, task in zip(task_params, created):
+        if task:
+            task_url = f"{bitrix_domain}/company/personal/user/1/tasks/task/view/{task['id']}/"
+            lines.append(f"✅ {params['title']}\n{task_url}")
+        else:
+            lines.append(f"❌ {params['title']}")
+
+    done = sum(1 for task in created if task)
+    await callback.message.edit_text(
+        f"📌 Задачи из встречи: {done}/{len(created)} создано\n\n" + "\n".join(lines),
+        disable_web_page_preview=True
+    )
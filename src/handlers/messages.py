@@ -9,14 +9,19 @@
 - Генерация вариантов ответа в личке
 """
 
+import asyncio
 from datetime import timedelta, datetime, timezone
 
 from aiogram import Router, types, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from apscheduler.jobstores.base import JobLookupError
 
 from src.config import settings
-from src.core import db, bot
+from src.core import db, async_db, bot, chat_history, send_message_throttled
 from src.services.openai_service import ai_service
+from src.services.need_answer_batcher import need_answer_batcher
+from src.services.need_answer_prefilter import need_answer_prefilter
+from src.services.open_threads import open_threads
 from src.utils.logging import get_logger
 from src.utils.time_utils import now_local, parse_timestamp, is_work_time, next_work_start
 
@@ -27,6 +32,9 @@ router = Router(name="messages")
 # Планировщик будет внедрён извне
 scheduler = None
 
+# Поля базы знаний, которые накапливаются, а не перезаписываются
+CLIENT_LIST_FIELDS = ("preferences", "dislikes")
+
 
 def set_scheduler(sched):
     """Устанавливает планировщик для отложенных задач."""
@@ -101,27 +109,67 @@ def _calculate_remind_at(commitment: dict) -> tuple[datetime, str]:
     return remind_at, "через 24 ч"
 
 
-async def check_for_commitments(message: types.Message, text: str):
-    """Проверяет сообщение проджекта на договорённости и создаёт напоминание."""
+def _merge_client_facts(known_facts: dict | None, facts: dict) -> dict:
+    """
+    Готовит новые факты к записи, не затирая накопленное.
+
+    preferences / dislikes дописываются к известному значению, остальные
+    поля заполняются только если пусты — их могли задать вручную.
+
+    Returns:
+        dict: Поля для upsert_client_knowledge (пусто — писать нечего)
+    """
+    known_facts = known_facts or {}
+    merged = {}
+
+    for field, value in facts.items():
+        current = (known_facts.get(field) or "").strip()
+        if not current:
+            merged[field] = value
+        elif field in CLIENT_LIST_FIELDS and value.lower() not in current.lower():
+            merged[field] = f"{current}; {value}"
+
+    return merged
+
+
+async def analyze_project_message(message: types.Message, text: str) -> dict | None:
+    """
+    Разбирает сообщение проджекта одним вызовом GPT.
+
+    Договорённость превращается в напоминание. Новые факты о клиенте
+    возвращаются вызывающему и пишутся в базу знаний только при
+    CLIENT_FACTS_AUTOSAVE. Известные факты берутся из кэша.
+
+    Returns:
+        dict | None: {"commitment", "client_facts"} или None, если сообщение не разбиралось
+    """
     # Пропускаем пересланные сообщения — это не обещания проджекта
     if message.forward_date or message.forward_from or message.forward_from_chat:
-        return
+        return None
 
+    analysis = None
     try:
-        # Получаем контекст
-        context = await get_recent_context(str(message.chat.id), int(message.message_id), limit=5)
+        chat_id = str(message.chat.id)
+        known_facts = await async_db.get_client_knowledge(chat_id)
+
+        analysis = await ai_service.analyze_project_message(text, known_facts)
 
-        # Проверяем через AI
-        commitment = await ai_service.extract_commitment(text, context)
+        client_facts = _merge_client_facts(known_facts, analysis["client_facts"])
+        if client_facts and settings.client_facts_autosave:
+            await async_db.upsert_client_knowledge(chat_id, **client_facts)
+            logger.info(f"База знаний {chat_id} дополнена: {', '.join(client_facts)}")
+        elif client_facts:
+            logger.info(f"Новые факты о клиенте {chat_id} (не сохранены): {client_facts}")
 
+        commitment = analysis["commitment"]
         if not commitment:
-            return
+            return analysis
 
         # Вычисляем время напоминания
         remind_at, time_str = _calculate_remind_at(commitment)
 
         # Создаём напоминание
-        reminder = db.create_reminder(
+        reminder = await async_db.create_reminder(
             chat_id=str(message.chat.id),
             chat_name=message.chat.title or "Unknown",
             project_id=message.from_user.id,
@@ -175,12 +223,14 @@ async def check_for_commitments(message: types.Message, text: str):
                 logger.warning(f"Не удалось отправить уведомление проджекту: {e}")
 
     except Exception as e:
-        logger.error(f"Ошибка проверки договорённостей: {e}")
+        logger.error(f"Ошибка анализа сообщения проджекта: {e}")
+
+    return analysis
 
 
 async def log_message(message: types.Message, is_project: bool) -> dict | None:
     """Логирует сообщение в БД."""
-    return db.log_message(
+    return await async_db.log_message(
         chat_id=str(message.chat.id),
         message_id=message.message_id,
         from_id=message.from_user.id,
@@ -192,8 +242,14 @@ async def log_message(message: types.Message, is_project: bool) -> dict | None:
 
 
 async def get_recent_context(chat_id: str, current_message_id: int, limit: int = 5) -> str:
-    """Получает последние N сообщений из чата для контекста."""
-    messages = db.get_recent_messages(chat_id, current_message_id, limit)
+    """Получает последние N сообщений из чата для контекста (из памяти, если есть)."""
+    messages = chat_history.get_before(chat_id, current_message_id, limit)
+    if messages is None:
+        messages = await async_db.get_recent_messages(chat_id, current_message_id, limit)
+        # Ошибка запроса — не «истории нет»: буфер не дополняем и не помечаем полным
+        if messages is None:
+            return ""
+        chat_history.seed(chat_id, current_message_id, messages, limit)
 
     if not messages:
         return ""
@@ -208,6 +264,231 @@ async def get_recent_context(chat_id: str, current_message_id: int, limit: int =
     return "\n".join(context_lines)
 
 
+def _schedule_check(
+    log_id: int,
+    chat_id: str,
+    message_id: int,
+    attempt: int,
+    run_at: datetime,
+    **job_kwargs
+):
+    """Планирует check_for_answer (один job на сообщение, повтор заменяет старый)."""
+    # В режиме sweeper напоминания разбирает единый цикл sweep_escalations
+    if not scheduler or settings.escalation_mode != "jobs":
+        return
+    scheduler.add_job(
+        check_for_answer,
+        "date",
+        run_date=run_at,
+        args=[log_id, chat_id, message_id, attempt],
+        id=f"check_for_answer:{log_id}",
+        replace_existing=True,
+        **job_kwargs
+    )
+
+
+async def restore_pending_escalations() -> int:
+    """
+    Восстанавливает запланированные напоминания после рестарта.
+
+    Одним проходом читает из chat_log все записи со status='waiting',
+    одним запросом закрывает те, на которые проджект уже ответил,
+    наполняет индекс открытых обращений и ставит для остальных
+    check_for_answer на pending_until (или сразу, если время уже прошло).
+    В режиме sweeper job'ы не создаются — только индекс.
+
+    Returns:
+        int: Количество восстановленных напоминаний
+    """
+    rows = await async_db.get_waiting_messages()
+    answers = await async_db.find_project_answers(
+        [(str(row["chat_id"]), int(row["message_id"])) for row in rows]
+    )
+    if answers is None:
+        # Не закрываем ничего оптом: check_for_answer / sweeper проверят ответ сами
+        logger.error("Ответы проджектов не проверены, восстанавливаем все записи как ожидающие")
+        answers = {}
+    now = now_local()
+    restored = 0
+
+    answered = [row for row in rows if (str(row["chat_id"]), int(row["message_id"])) in answers]
+    closed = await async_db.mark_messages_answered([
+        (row["id"], answers[(str(row["chat_id"]), int(row["message_id"]))])
+        for row in answered
+    ]) if answered else True
+    if not closed:
+        # Остаются waiting в БД — пусть их закроют check_for_answer / sweeper
+        logger.error(f"Не удалось закрыть {len(answered)} отвеченных обращений, оставляем ожидающими")
+        answers = {}
+        answered = []
+
+    waiting = [row for row in rows if (str(row["chat_id"]), int(row["message_id"])) not in answers]
+    open_threads.load(waiting)
+
+    for row in waiting:
+        try:
+            pending_until = row.get("pending_until")
+            run_at = parse_timestamp(pending_until).astimezone(settings.timezone) if pending_until else now
+            _schedule_check(
+                row["id"],
+                str(row["chat_id"]),
+                int(row["message_id"]),
+                int(row.get("escalation_attempt") or 0),
+                max(run_at, now),
+                misfire_grace_time=None,
+                coalesce=True
+            )
+            restored += 1
+        except Exception as e:
+            logger.error(f"Не удалось восстановить напоминание log_id={row.get('id')}: {e}")
+
+    logger.info(f"Восстановлено напоминаний: {restored}, закрыто отвеченных: {len(answered)}")
+    return restored
+
+
+async def _mark_answered(log_id: int, chat_id: str, answer: dict):
+    """Закрывает сообщение клиента как отвеченное."""
+    open_threads.remove(chat_id, log_id)
+    await async_db.update_message_status(
+        log_id,
+        status="answered",
+        answered_by=answer.get("from_name"),
+        answered_message_id=answer.get("message_id"),
+        answered_text=answer.get("text", ""),
+        answered_at=now_local().isoformat()
+    )
+    logger.info(f"Ответ найден, закрыли log_id={log_id}")
+
+
+def _unschedule_check(log_id: int):
+    """Снимает запланированный check_for_answer, если он есть."""
+    if not scheduler:
+        return
+    try:
+        scheduler.remove_job(f"check_for_answer:{log_id}")
+    except JobLookupError:
+        pass
+
+
+async def close_answered_threads(message: types.Message) -> int:
+    """
+    Закрывает все открытые обращения чата, как только в нём написал проджект.
+
+    Returns:
+        int: Количество закрытых обращений
+    """
+    chat_id = str(message.chat.id)
+    answered = open_threads.pop_answered(chat_id, int(message.message_id))
+    if not answered:
+        return 0
+
+    log_ids = list(answered)
+    updated = await async_db.update_messages_status(
+        log_ids,
+        status="answered",
+        answered_by=message.from_user.full_name,
+        answered_message_id=message.message_id,
+        answered_text=message.text or "",
+        answered_at=now_local().isoformat()
+    )
+    if not updated:
+        # В БД они остались waiting — возвращаем в индекс, проверки не снимаем
+        for log_id, message_id in answered.items():
+            open_threads.add(chat_id, log_id, message_id)
+        logger.error(f"Не удалось закрыть обращения чата {chat_id}: {log_ids}")
+        return 0
+
+    for log_id in log_ids:
+        _unschedule_check(log_id)
+
+    logger.info(f"Проджект ответил в чате {chat_id}, закрыто обращений: {len(log_ids)}")
+    return len(log_ids)
+
+
+async def _send_escalation(msg: dict, attempt: int, owner: dict | None):
+    """Отправляет напоминание о неотвеченном сообщении владельцу и проджекту чата."""
+    chat_id = str(msg.get("chat_id"))
+    message_id = int(msg.get("message_id"))
+
+    labels = ["15 минут", "30 минут", "1 час"]
+    label = labels[min(attempt, len(labels) - 1)]
+    thread_key = msg.get("thread_key") or f"{chat_id}:{message_id}"
+
+    notification_text = (
+        f"⏰ Напоминание ({label})\n\n"
+        f"🏷️ Чат: {msg.get('chat_name', 'Unknown')}\n"
+        f"👤 От: {msg.get('from_name', 'Unknown')}\n"
+        f"💬 Сообщение: {msg.get('text', '')}\n"
+        f"🔗 Ключ: {thread_key}\n"
+    )
+
+    # На первом напоминании добавляем предложение
+    if attempt == 0:
+        context = await get_recent_context(chat_id, message_id, limit=5)
+        suggested_reply, tasks = await ai_service.generate_suggestion_and_tasks(
+            msg.get("text", ""), context
+        )
+
+        tasks_block = "\n".join([f"{i}. {t}" for i, t in enumerate(tasks, 1)])
+
+        notification_text += (
+            f"\n🤖 Предложенный ответ:\n{suggested_reply}\n\n"
+            f"📝 Задачи:\n{tasks_block}"
+        )
+
+    # Отправляем владельцу (с учётом лимитов Telegram — sweeper рассылает пачкой)
+    await send_message_throttled(settings.owner_id, notification_text)
+
+    # Отправляем проджекту-владельцу чата (если есть и это не владелец)
+    if owner:
+        project_id = int(owner["project_id"])
+        if project_id != settings.owner_id:
+            await send_message_throttled(project_id, notification_text)
+
+
+async def _advance_escalation(msg: dict, attempt: int) -> tuple[bool, datetime | None]:
+    """
+    Переводит сообщение на следующую ступень эскалации.
+
+    Returns:
+        tuple[bool, datetime | None]: Записано ли в БД и время следующего
+                                      напоминания (None при финальной эскалации)
+    """
+    log_id = msg["id"]
+    next_attempt = attempt + 1
+
+    if next_attempt < len(settings.escalation_delays):
+        base_time = parse_timestamp(msg["timestamp"])
+        base_time = base_time.astimezone(settings.timezone)
+
+        run_at = base_time + timedelta(seconds=settings.escalation_delays[next_attempt])
+
+        if not is_work_time(run_at):
+            run_at = next_work_start(run_at)
+
+        saved = await async_db.update_message_status(
+            log_id,
+            status="waiting",
+            pending_until=run_at.isoformat(),
+            escalation_attempt=next_attempt,
+            last_checked_at=now_local().isoformat()
+        )
+
+        run_at = run_at.astimezone(settings.timezone)
+        logger.info(f"Следующее напоминание запланировано на {run_at.isoformat()}")
+        return saved, run_at
+
+    saved = await async_db.update_message_status(
+        log_id,
+        status="escalated",
+        last_checked_at=now_local().isoformat()
+    )
+    if saved:
+        open_threads.remove(msg["chat_id"], log_id)
+    logger.info(f"Финальная эскалация, log_id={log_id}")
+    return saved, None
+
+
 async def check_for_answer(log_id: int, chat_id: str, message_id: int, attempt: int):
     """
     Проверяет, был ли ответ на сообщение клиента.
@@ -219,7 +500,7 @@ async def check_for_answer(log_id: int, chat_id: str, message_id: int, attempt:
     logger.info(f"check_for_answer: attempt={attempt}, now={now_local().isoformat()}")
 
     try:
-        msg = db.get_message_by_id(log_id)
+        msg = await async_db.get_message_by_id(log_id)
         if not msg:
             return
 
@@ -229,109 +510,86 @@ async def check_for_answer(log_id: int, chat_id: str, message_id: int, attempt:
         # Рабочее время: если нельзя — перенести
         if not is_work_time(now_local()):
             run_at = next_work_start(now_local())
-            if scheduler:
-                scheduler.add_job(
-                    check_for_answer,
-                    "date",
-                    run_date=run_at,
-                    args=[log_id, chat_id, message_id, attempt]
-                )
+            _schedule_check(log_id, chat_id, message_id, attempt, run_at)
             logger.info(f"Нерабочее время -> перенёс attempt={attempt} на {run_at.isoformat()}")
             return
 
         # Проверяем: ответил ли проджект после message_id
-        answer = db.find_project_answer(chat_id, message_id)
+        answer = await async_db.find_project_answer(chat_id, message_id)
 
         if answer:
-            db.update_message_status(
-                log_id,
-                status="answered",
-                answered_by=answer.get("from_name"),
-                answered_message_id=answer.get("message_id"),
-                answered_text=answer.get("text", ""),
-                answered_at=now_local().isoformat()
-            )
-            logger.info(f"Ответ найден, закрыли log_id={log_id}")
+            await _mark_answered(log_id, chat_id, answer)
             return
 
-        # Ответа нет → формируем уведомление
-        labels = ["15 минут", "30 минут", "1 час"]
-        label = labels[min(attempt, len(labels) - 1)]
-        thread_key = msg.get("thread_key") or f"{chat_id}:{message_id}"
-
-        notification_text = (
-            f"⏰ Напоминание ({label})\n\n"
-            f"🏷️ Чат: {msg.get('chat_name', 'Unknown')}\n"
-            f"👤 От: {msg.get('from_name', 'Unknown')}\n"
-            f"💬 Сообщение: {msg.get('text', '')}\n"
-            f"🔗 Ключ: {thread_key}\n"
-        )
-
-        # На первом напоминании добавляем предложение
-        if attempt == 0:
-            context = await get_recent_context(chat_id, int(message_id), limit=5)
-            suggested_reply, tasks = await ai_service.generate_suggestion_and_tasks(
-                msg.get("text", ""), context
-            )
+        # Ответа нет → уведомляем
+        owner = await async_db.get_chat_owner(chat_id)
+        await _send_escalation(msg, attempt, owner)
 
-            tasks_block = "\n".join([f"{i}. {t}" for i, t in enumerate(tasks, 1)])
-
-            notification_text += (
-                f"\n🤖 Предложенный ответ:\n{suggested_reply}\n\n"
-                f"📝 Задачи:\n{tasks_block}"
-            )
+        # Планируем следующее напоминание
+        _, run_at = await _advance_escalation(msg, attempt)
+        if run_at:
+            _schedule_check(log_id, chat_id, message_id, attempt + 1, run_at)
 
-        # Отправляем владельцу
-        await bot.send_message(settings.owner_id, notification_text)
+    except Exception as e:
+        logger.error(f"Ошибка check_for_answer: {e}")
 
-        # Отправляем проджекту-владельцу чата (если есть и это не владелец)
-        owner = db.get_chat_owner(chat_id)
-        if owner:
-            project_id = int(owner["project_id"])
-            if project_id != settings.owner_id:
-                await bot.send_message(project_id, notification_text)
 
-        # Планируем следующее напоминание
-        next_attempt = attempt + 1
-        if next_attempt < len(settings.escalation_delays):
-            ts = msg["timestamp"]
-            base_time = parse_timestamp(ts)
-            base_time = base_time.astimezone(settings.timezone)
-
-            run_at = base_time + timedelta(seconds=settings.escalation_delays[next_attempt])
-
-            if not is_work_time(run_at):
-                run_at = next_work_start(run_at)
-
-            db.update_message_status(
-                log_id,
-                status="waiting",
-                pending_until=run_at.isoformat(),
-                last_checked_at=now_local().isoformat()
-            )
+async def sweep_escalations():
+    """
+    Единый цикл эскалаций (ESCALATION_MODE=sweeper).
 
-            run_at = run_at.astimezone(settings.timezone)
+    Вместо отдельного job на каждое сообщение раз в интервал забирает
+    из chat_log все созревшие записи со status='waiting', одним запросом
+    проверяет ответы проджектов и рассылает напоминания.
+    """
+    now = now_local()
+    if not is_work_time(now):
+        return
 
-            if scheduler:
-                scheduler.add_job(
-                    check_for_answer,
-                    "date",
-                    run_date=run_at,
-                    args=[log_id, chat_id, message_id, next_attempt]
-                )
+    try:
+        due = await async_db.get_due_waiting_messages(now, limit=settings.escalation_sweep_batch)
+        if not due:
+            return
 
-            logger.info(f"Следующее напоминание запланировано на {run_at.isoformat()}")
+        answers = await async_db.find_project_answers(
+            [(str(row["chat_id"]), int(row["message_id"])) for row in due]
+        )
+        if answers is None:
+            # Без ответов нельзя отличить отвеченные — повторим в следующем цикле
+            logger.error("Sweeper: ответы проджектов не проверены, цикл пропущен")
+            return
+        owners = await async_db.get_chat_owners(list({str(row["chat_id"]) for row in due}))
+        if owners is None:
+            logger.error("Sweeper: владельцы чатов не получены, цикл пропущен")
+            return
 
-        else:
-            db.update_message_status(
-                log_id,
-                status="escalated",
-                last_checked_at=now_local().isoformat()
-            )
-            logger.info(f"Финальная эскалация, log_id={log_id}")
+        semaphore = asyncio.Semaphore(settings.escalation_sweep_concurrency)
+
+        async def process(row: dict):
+            async with semaphore:
+                try:
+                    key = (str(row["chat_id"]), int(row["message_id"]))
+                    answer = answers.get(key)
+                    if answer:
+                        await _mark_answered(row["id"], key[0], answer)
+                        return
+
+                    # Сначала сдвигаем pending_until: если запись не прошла,
+                    # следующий цикл не разошлёт то же напоминание повторно
+                    attempt = int(row.get("escalation_attempt") or 0)
+                    saved, _ = await _advance_escalation(row, attempt)
+                    if not saved:
+                        logger.error(f"Sweeper: ступень эскалации log_id={row['id']} не записана, напоминание отложено")
+                        return
+                    await _send_escalation(row, attempt, owners.get(key[0]))
+                except Exception as e:
+                    logger.error(f"Ошибка эскалации log_id={row.get('id')}: {e}")
+
+        await asyncio.gather(*(process(row) for row in due))
+        logger.info(f"Sweeper: обработано {len(due)} сообщений, отвечено {len(answers)}")
 
     except Exception as e:
-        logger.error(f"Ошибка check_for_answer: {e}")
+        logger.error(f"Ошибка sweep_escalations: {e}")
 
 
 @router.message(F.chat.type == "private")
@@ -563,24 +821,28 @@ async def handle_message(message: types.Message):
 
     # Если проджект — закрепляем (но не владельца)
     if is_project and user_id != settings.owner_id:
-        db.upsert_chat_owner(
+        await async_db.upsert_chat_owner(
             str(message.chat.id),
             message.chat.title or "Unknown",
             user_id,
             message.from_user.full_name,
         )
 
-    # Если проджект — проверяем на договорённости
+    # Если проджект — закрываем открытые обращения и разбираем сообщение
     if is_project:
-        await check_for_commitments(message, text)
+        await close_answered_threads(message)
+        await analyze_project_message(message, text)
 
     # Если НЕ проджект — анализируем (клиент/участник)
     if not is_project:
-        context = await get_recent_context(str(message.chat.id), int(message.message_id), limit=5)
-        need_answer = await ai_service.check_if_need_answer(text, context)
+        # Очевидные случаи решаем без контекста и GPT
+        need_answer = need_answer_prefilter.classify(text)
+        if need_answer is None:
+            context = await get_recent_context(str(message.chat.id), int(message.message_id), limit=5)
+            need_answer = await need_answer_batcher.classify(text, context)
 
         if not need_answer:
-            db.update_message_status(
+            await async_db.update_message_status(
                 logged["id"],
                 status="ignored",
                 need_answer=False
@@ -596,21 +858,17 @@ async def handle_message(message: types.Message):
         if not is_work_time(run_at):
             run_at = next_work_start(run_at)
 
-        db.update_message_status(
+        await async_db.update_message_status(
             logged["id"],
             status="waiting",
             need_answer=True,
-            pending_until=run_at.isoformat()
+            pending_until=run_at.isoformat(),
+            escalation_attempt=0
         )
+        open_threads.add(str(message.chat.id), logged["id"], int(message.message_id))
 
         run_at = run_at.astimezone(settings.timezone)
 
-        if scheduler:
-            scheduler.add_job(
-                check_for_answer,
-                "date",
-                run_date=run_at,
-                args=[logged["id"], str(message.chat.id), int(message.message_id), 0]
-            )
+        _schedule_check(logged["id"], str(message.chat.id), int(message.message_id), 0, run_at)
 
         logger.info(f"1-е напоминание запланировано на {run_at.isoformat()}")
@@ -13,10 +13,12 @@ import asyncio
 from aiohttp import web
 
 from src.config import settings
-from src.core import bot, dp
+from src.core import bot, dp, async_db, chat_activity
 from src.handlers import commands_router, messages_router
-from src.handlers.messages import set_scheduler
+from src.handlers.messages import set_scheduler, restore_pending_escalations, sweep_escalations
 from src.services import SchedulerService
+from src.services.bitrix_service import bitrix_service
+from src.services.response_cache import response_cache
 from src.webhooks import create_webhook_app
 from src.utils.logging import get_logger
 
@@ -47,20 +49,46 @@ async def main():
     dp.include_router(commands_router)
     dp.include_router(messages_router)
 
+    # Кэш ответов GPT с прошлого запуска
+    response_cache.load()
+
+    # Загружаем последнюю активность по чатам
+    chat_activity.load(await async_db.get_chat_activity())
+
+    # Пользователи и группы Битрикс24 — одним batch-запросом
+    if settings.bitrix_webhook_url:
+        await bitrix_service.warm_cache()
+
     # Запуск webhook-сервера
     await start_webhook_server()
 
-    # Запуск планировщика
+    # Планировщик: передаём в обработчик сообщений и восстанавливаем
+    # напоминания до старта, чтобы они добавились одной пачкой
     scheduler_service = SchedulerService()
-    scheduler_service.start()
-
-    # Передаём планировщик в обработчик сообщений
     set_scheduler(scheduler_service.get_scheduler())
+    if settings.escalation_mode == "sweeper":
+        scheduler_service.get_scheduler().add_job(
+            sweep_escalations,
+            "interval",
+            seconds=settings.escalation_sweep_interval,
+            id="escalation_sweeper",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        logger.info(f"Эскалации: единый цикл каждые {settings.escalation_sweep_interval} сек")
+    await restore_pending_escalations()
+    scheduler_service.start()
 
     logger.info("Ctrl+C для остановки")
 
     # Запуск polling
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        response_cache.save()
+        await bitrix_service.close()
+        await async_db.close()
 
 
 if __name__ == "__main__":
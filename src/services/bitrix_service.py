@@ -4,9 +4,15 @@
 Создание задач, получение пользователей и групп.
 """
 
+import asyncio
+import bisect
+import re
+import time
+
 import aiohttp
 from typing import Optional
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
 
 from src.config import settings
 from src.utils.logging import get_logger
@@ -14,6 +20,98 @@ from src.utils.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Максимум команд в одном запросе batch
+BATCH_LIMIT = 50
+
+# Слова названия: кавычки, дефисы, слэши и прочая пунктуация — разделители
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _build_query(params: dict | list, prefix: str = "") -> list[tuple[str, str]]:
+    """
+    Разворачивает вложенные параметры в пары ключ-значение в стиле PHP
+    (FILTER[ACTIVE]=Y, select[0]=ID) — так их ждёт batch.
+    """
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    pairs = []
+    for key, value in items:
+        full_key = f"{prefix}[{key}]" if prefix else str(key)
+        if isinstance(value, (dict, list)):
+            pairs.extend(_build_query(value, full_key))
+        elif isinstance(value, bool):
+            pairs.append((full_key, "true" if value else "false"))
+        elif value is not None:
+            pairs.append((full_key, str(value)))
+    return pairs
+
+
+class _NameIndex:
+    """
+    Индекс записей {id, name} по словам названия.
+
+    Поиск — по началу слов: "Иван П" найдёт "Иван Петров". Если точного
+    совпадения по началу нет, слова запроса укорачиваются на окончание
+    ("Ивану" -> "Иван"), чтобы находить имена в падежах. Если и так
+    ничего не нашлось — поиск подстрокой по всем названиям, как раньше.
+    """
+
+    def __init__(self, items: list[dict]):
+        self._items = items
+        self._full: dict[str, int] = {}
+        token_positions: dict[str, set[int]] = {}
+
+        for pos, item in enumerate(items):
+            name = item['name'].lower().strip()
+            self._full.setdefault(name, pos)
+            for token in _TOKEN_RE.findall(name):
+                token_positions.setdefault(token, set()).add(pos)
+
+        self._tokens = sorted(token_positions)
+        self._positions = [token_positions[token] for token in self._tokens]
+
+    def _match_prefix(self, prefix: str) -> set[int]:
+        """Позиции записей, у которых есть слово с таким началом."""
+        matched: set[int] = set()
+        i = bisect.bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            matched |= self._positions[i]
+            i += 1
+        return matched
+
+    def _match(self, query_tokens: list[str]) -> set[int]:
+        candidates: set[int] | None = None
+        for token in query_tokens:
+            matched = self._match_prefix(token)
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return set()
+        return candidates or set()
+
+    def find(self, name: str) -> dict | None:
+        """Находит первую подходящую запись или None."""
+        query = name.lower().strip()
+        if not query:
+            return None
+
+        if query in self._full:
+            return self._items[self._full[query]]
+
+        query_tokens = _TOKEN_RE.findall(query)
+        candidates = self._match(query_tokens) if query_tokens else set()
+        if not candidates and query_tokens:
+            candidates = self._match([
+                token[:-2] if len(token) > 4 else token
+                for token in query_tokens
+            ])
+        if candidates:
+            return self._items[min(candidates)]
+
+        # Подстрока посреди слова или с пунктуацией ("ромашка»", "seo-")
+        for item in self._items:
+            if query in item['name'].lower():
+                return item
+        return None
+
 
 class BitrixService:
     """Сервис для работы с Битрикс24."""
@@ -22,6 +120,33 @@ class BitrixService:
         self.webhook_url = settings.bitrix_webhook_url.rstrip('/')
         self._users_cache: dict = {}
         self._groups_cache: list = []
+        self._users_index = _NameIndex([])
+        self._groups_index = _NameIndex([])
+        self._loaded_at: float | None = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом keep-alive соединений к порталу."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.bitrix_pool_size,
+                    keepalive_timeout=60,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=settings.bitrix_timeout,
+                    connect=settings.bitrix_connect_timeout,
+                ),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию (при остановке бота)."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def _call_api(self, method: str, params: dict = None) -> dict | None:
         """
@@ -41,65 +166,210 @@ class BitrixService:
         url = f"{self.webhook_url}/{method}"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=params or {}) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if 'error' in data:
-                            logger.error(f"Bitrix API error: {data['error']} - {data.get('error_description', '')}")
-                            return None
-                        return data
-                    else:
-                        logger.error(f"Bitrix API HTTP error: {response.status}")
+            async with self._get_session().post(url, json=params or {}) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if 'error' in data:
+                        logger.error(f"Bitrix API error: {data['error']} - {data.get('error_description', '')}")
                         return None
+                    return data
+                else:
+                    logger.error(f"Bitrix API HTTP error: {response.status}")
+                    return None
         except Exception as e:
             logger.error(f"Bitrix API call failed: {e}")
             return None
 
-    async def get_users(self, force_refresh: bool = False) -> list:
+    async def call_batch(self, commands: dict[str, tuple[str, dict]]) -> dict[str, dict | list | None]:
         """
-        Получить список пользователей Битрикс24.
+        Выполняет несколько методов API через batch (до 50 команд за запрос).
+
+        Args:
+            commands: {ключ: (метод, параметры)}
 
         Returns:
-            list: Список пользователей [{id, name}, ...]
+            dict: {ключ: result команды или None при ошибке}
         """
-        if self._users_cache and not force_refresh:
-            return list(self._users_cache.values())
+        results, _ = await self._batch(commands)
+        return results
 
-        result = await self._call_api('user.get', {'ACTIVE': True})
-        if not result or 'result' not in result:
-            return []
+    async def _batch(
+        self,
+        commands: dict[str, tuple[str, dict]]
+    ) -> tuple[dict[str, dict | list | None], dict[str, int]]:
+        """batch с общим количеством записей (result_total) по каждой команде."""
+        results: dict[str, dict | list | None] = {key: None for key in commands}
+        totals: dict[str, int] = {}
+        keys = list(commands)
+
+        for start in range(0, len(keys), BATCH_LIMIT):
+            chunk = keys[start:start + BATCH_LIMIT]
+            cmd = {}
+            for key in chunk:
+                method, params = commands[key]
+                query = urlencode(_build_query(params or {}))
+                cmd[key] = f"{method}?{query}" if query else method
+
+            response = await self._call_api('batch', {'halt': 0, 'cmd': cmd})
+            if not response or 'result' not in response:
+                continue
+
+            batch_result = response['result']
+            for key, error in (batch_result.get('result_error') or {}).items():
+                logger.error(f"Bitrix batch error in {key}: {error}")
+
+            command_results = batch_result.get('result') or {}
+            command_totals = batch_result.get('result_total') or {}
+            for key in chunk:
+                if key in command_results:
+                    results[key] = command_results[key]
+                if key in command_totals:
+                    totals[key] = int(command_totals[key])
+
+        return results, totals
+
+    async def _fetch_all(self, requests: dict[str, tuple[str, dict]]) -> dict[str, list | None]:
+        """
+        Загружает все страницы списочных методов (по 50 записей).
 
-        users = []
-        for user in result['result']:
-            user_data = {
+        Первые страницы всех методов — одним batch, остальные страницы
+        (start=50, 100, ...) — следующим batch.
+
+        Args:
+            requests: {ключ: (метод, параметры)}
+
+        Returns:
+            dict: {ключ: все записи или None при ошибке}
+        """
+        first, totals = await self._batch(requests)
+
+        rest = {}
+        for key, (method, params) in requests.items():
+            if first[key] is None:
+                continue
+            for page_start in range(BATCH_LIMIT, totals.get(key, 0), BATCH_LIMIT):
+                rest[f"{key}:{page_start}"] = (method, {**params, 'start': page_start})
+
+        pages, _ = await self._batch(rest) if rest else ({}, {})
+
+        results: dict[str, list | None] = {}
+        for key in requests:
+            if first[key] is None:
+                results[key] = None
+                continue
+            items = list(first[key])
+            for page_start in range(BATCH_LIMIT, totals.get(key, 0), BATCH_LIMIT):
+                page = pages.get(f"{key}:{page_start}")
+                if page is None:
+                    # Неполный список хуже старого кэша
+                    logger.error(f"Bitrix: не загрузилась страница {page_start} для {key}")
+                    items = None
+                    break
+                items.extend(page)
+            results[key] = items
+
+        return results
+
+    def _store_users(self, raw_users: list) -> None:
+        """Кэширует пользователей из ответа user.get и строит индекс по имени."""
+        users = {}
+        for user in raw_users:
+            users[user['ID']] = {
                 'id': user['ID'],
                 'name': f"{user.get('NAME', '')} {user.get('LAST_NAME', '')}".strip(),
                 'email': user.get('EMAIL', ''),
             }
-            self._users_cache[user['ID']] = user_data
-            users.append(user_data)
+        self._users_cache = users
+        self._users_index = _NameIndex(list(users.values()))
+
+    def _store_groups(self, raw_groups: list) -> None:
+        """Кэширует группы из ответа sonet_group.get и строит индекс по названию."""
+        self._groups_cache = [
+            {'id': g['ID'], 'name': g['NAME']}
+            for g in raw_groups
+        ]
+        self._groups_index = _NameIndex(self._groups_cache)
+
+    def _is_stale(self) -> bool:
+        """Кэш пуст или старше BITRIX_CACHE_TTL."""
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > settings.bitrix_cache_ttl
+        )
+
+    async def warm_cache(self, force_refresh: bool = False) -> None:
+        """
+        Загружает всех пользователей и группы (с пагинацией) через batch.
+
+        Параллельные вызовы ждут одну загрузку. Без force_refresh свежий
+        кэш не перезагружается.
+        """
+        started_at = time.monotonic()
+        async with self._refresh_lock:
+            # Пока ждали блокировку, кэш уже обновили
+            if self._loaded_at is not None and self._loaded_at >= started_at:
+                return
+            if not force_refresh and not self._is_stale():
+                return
+
+            results = await self._fetch_all({
+                'users': ('user.get', {'ACTIVE': True}),
+                'groups': ('sonet_group.get', {
+                    'FILTER': {'ACTIVE': 'Y'},
+                    'SELECT': ['ID', 'NAME']
+                }),
+            })
+
+            if results['users'] is not None:
+                self._store_users(results['users'])
+            if results['groups'] is not None:
+                self._store_groups(results['groups'])
+
+            # При ошибке оставляем старые данные и пробуем снова при следующем запросе
+            if results['users'] is not None and results['groups'] is not None:
+                self._loaded_at = time.monotonic()
+
+        logger.info(
+            f"Кэш Битрикс24: {len(self._users_cache)} пользователей, "
+            f"{len(self._groups_cache)} групп"
+        )
+
+    async def _ensure_cache(self, force_refresh: bool = False) -> None:
+        """
+        Готовит кэш к чтению.
+
+        Пустой кэш загружается сразу. Устаревший отдаётся как есть,
+        а обновляется в фоне — пользователь в /task не ждёт Битрикс.
+        """
+        if force_refresh or (not self._users_cache and not self._groups_cache):
+            await self.warm_cache(force_refresh=force_refresh)
+            return
 
-        return users
+        if self._is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.warm_cache())
+
+    async def get_users(self, force_refresh: bool = False) -> list:
+        """
+        Получить список пользователей Битрикс24.
+
+        Returns:
+            list: Список пользователей [{id, name}, ...]
+        """
+        await self._ensure_cache(force_refresh)
+        return list(self._users_cache.values())
 
     async def get_user_by_name(self, name: str) -> dict | None:
         """
         Найти пользователя по имени.
 
         Args:
-            name: Имя или часть имени
+            name: Имя, фамилия или их начало ("Иван", "Петров", "Иван П")
 
         Returns:
             dict: Данные пользователя или None
         """
-        users = await self.get_users()
-        name_lower = name.lower()
-
-        for user in users:
-            if name_lower in user['name'].lower():
-                return user
-
-        return None
+        await self._ensure_cache()
+        return self._users_index.find(name)
 
     async def get_groups(self, force_refresh: bool = False) -> list:
         """
@@ -108,22 +378,7 @@ class BitrixService:
         Returns:
             list: Список групп [{id, name}, ...]
         """
-        if self._groups_cache and not force_refresh:
-            return self._groups_cache
-
-        result = await self._call_api('sonet_group.get', {
-            'FILTER': {'ACTIVE': 'Y'},
-            'SELECT': ['ID', 'NAME']
-        })
-
-        if not result or 'result' not in result:
-            return []
-
-        self._groups_cache = [
-            {'id': g['ID'], 'name': g['NAME']}
-            for g in result['result']
-        ]
-
+        await self._ensure_cache(force_refresh)
         return self._groups_cache
 
     async def get_group_by_name(self, name: str) -> dict | None:
@@ -131,19 +386,13 @@ class BitrixService:
         Найти группу по названию.
 
         Args:
-            name: Название или часть названия
+            name: Название или начало слов названия
 
         Returns:
             dict: Данные группы или None
         """
-        groups = await self.get_groups()
-        name_lower = name.lower()
-
-        for group in groups:
-            if name_lower in group['name'].lower():
-                return group
-
-        return None
+        await self._ensure_cache()
+        return self._groups_index.find(name)
 
     async def create_task(
         self,
@@ -170,6 +419,36 @@ class BitrixService:
         Returns:
             dict: Данные созданной задачи или None
         """
+        fields = self._task_fields(
+            title, description, responsible_id, creator_id, group_id, deadline, priority
+        )
+
+        result = await self._call_api('tasks.task.add', {'fields': fields})
+
+        if result and 'result' in result:
+            task_data = result['result'].get('task', {})
+            task_id = task_data.get('id') or result['result'].get('id')
+            logger.info(f"Создана задача в Битрикс24: {task_id} - {title}")
+            return {
+                'id': task_id,
+                'title': title,
+                'responsible_id': fields['RESPONSIBLE_ID'],
+                'group_id': group_id,
+            }
+
+        return None
+
+    @staticmethod
+    def _task_fields(
+        title: str,
+        description: str = "",
+        responsible_id: int | str = None,
+        creator_id: int | str = None,
+        group_id: int | str = None,
+        deadline: datetime = None,
+        priority: int = 1
+    ) -> dict:
+        """Поля задачи для tasks.task.add."""
         # Если ответственный не указан — назначаем создателю
         if responsible_id is None:
             responsible_id = creator_id or 1
@@ -190,20 +469,43 @@ class BitrixService:
         if deadline:
             fields['DEADLINE'] = deadline.strftime('%Y-%m-%dT%H:%M:%S')
 
-        result = await self._call_api('tasks.task.add', {'fields': fields})
+        return fields
 
-        if result and 'result' in result:
-            task_data = result['result'].get('task', {})
-            task_id = task_data.get('id') or result['result'].get('id')
-            logger.info(f"Создана задача в Битрикс24: {task_id} - {title}")
-            return {
+    async def create_tasks(self, tasks: list[dict]) -> list[dict | None]:
+        """
+        Создаёт несколько задач через batch.
+
+        Args:
+            tasks: Список параметров как у create_task
+                   [{title, description, responsible_id, creator_id, group_id, deadline, priority}]
+
+        Returns:
+            list: Данные созданных задач (None для неудавшихся) в том же порядке
+        """
+        fields_list = [self._task_fields(**task) for task in tasks]
+        results = await self.call_batch({
+            f"task{i}": ('tasks.task.add', {'fields': fields})
+            for i, fields in enumerate(fields_list)
+        })
+
+        created = []
+        for i, fields in enumerate(fields_list):
+            result = results.get(f"task{i}")
+            if not result:
+                created.append(None)
+                continue
+
+            task_data = result.get('task', {})
+            task_id = task_data.get('id') or result.get('id')
+            created.append({
                 'id': task_id,
-                'title': title,
-                'responsible_id': responsible_id,
-                'group_id': group_id,
-            }
+                'title': fields['TITLE'],
+                'responsible_id': fields['RESPONSIBLE_ID'],
+                'group_id': fields.get('GROUP_ID'),
+            })
 
-        return None
+        logger.info(f"Создано задач в Битрикс24 пакетом: {sum(1 for t in created if t)}/{len(tasks)}")
+        return created
 
     async def get_task(self, task_id: int | str) -> dict | None:
         """
@@ -0,0 +1,91 @@
+"""
+Пакетная классификация сообщений клиентов.
+
+Запросы "нужен ли ответ" копятся короткое окно (или до N штук)
+и уходят в GPT одним вызовом. Результаты раздаются ожидающим обработчикам.
+"""
+
+import asyncio
+
+from src.config import settings
+from src.services.openai_service import ai_service
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class NeedAnswerBatcher:
+    """Собирает запросы классификации в пачки."""
+
+    def __init__(self, window_ms: int, max_size: int):
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def classify(self, text: str, context: str = "") -> bool:
+        """
+        Ставит сообщение в очередь и ждёт результат пачки.
+
+        Args:
+            text: Текст сообщения
+            context: Контекст предыдущих сообщений
+
+        Returns:
+            bool: True если нужен ответ
+        """
+        if self.max_size <= 1 or self.window <= 0:
+            return await ai_service.check_if_need_answer(text, context)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, context, future))
+
+        if len(self._pending) >= self.max_size:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            task = asyncio.create_task(self._flush(self._take()))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    def _take(self) -> list[tuple[str, str, asyncio.Future]]:
+        """Забирает накопленную пачку."""
+        batch, self._pending = self._pending, []
+        return batch
+
+    async def _flush_later(self):
+        """Отправляет пачку по истечении окна."""
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self._flush(self._take())
+
+    async def _flush(self, batch: list[tuple[str, str, asyncio.Future]]):
+        """Классифицирует пачку и раздаёт результаты."""
+        if not batch:
+            return
+
+        try:
+            results = await ai_service.check_if_need_answer_batch(
+                [(text, context) for text, context, _ in batch]
+            )
+            logger.info(f"Классифицирована пачка из {len(batch)} сообщений")
+        except Exception as e:
+            logger.error(f"Ошибка пакетной классификации: {e}")
+            results = [False] * len(batch)
+
+        for (_, _, future), need_answer in zip(batch, results):
+            if not future.done():
+                future.set_result(need_answer)
+
+
+# Глобальный экземпляр
+need_answer_batcher = NeedAnswerBatcher(
+    window_ms=settings.need_answer_batch_window_ms,
+    max_size=settings.need_answer_batch_size,
+)
@@ -0,0 +1,93 @@
+"""
+Быстрая предварительная классификация "нужен ли ответ" без GPT.
+
+Очевидные случаи решаются правилами: сообщение только из эмодзи,
+короткое "ок" / "спасибо" / "понял" — ответ не нужен; явный вопрос
+со знаком "?" — нужен. Всё неоднозначное уходит в GPT.
+"""
+
+import re
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Слова-подтверждения и благодарности, на которые не нужно отвечать
+ACK_WORDS = {
+    "ок", "окей", "ok", "okay", "оке",
+    "да", "ага", "угу", "ясно", "понял", "поняла", "поняли", "понятно",
+    "принято", "принял", "приняла", "хорошо", "отлично", "супер", "класс",
+    "круто", "здорово", "прекрасно", "договорились", "согласен", "согласна",
+    "спасибо", "спс", "благодарю", "благодарим", "пасиб", "пасибо", "мерси",
+    "большое", "огромное", "вам", "тебе", "все", "ладно",
+    "thanks", "thx", "+", "++",
+}
+
+# Сколько слов может быть в подтверждении ("ок, спасибо большое")
+MAX_ACK_WORDS = 4
+
+_WORD_RE = re.compile(r"[\w+]+", re.UNICODE)
+_MEANINGFUL_RE = re.compile(r"[^\W_]", re.UNICODE)
+
+
+class NeedAnswerPrefilter:
+    """Правила для очевидных случаев + счётчики попаданий."""
+
+    def __init__(self):
+        self.total = 0
+        self.no_answer = 0
+        self.answer = 0
+
+    def classify(self, text: str) -> bool | None:
+        """
+        Классифицирует сообщение без GPT, если случай очевиден.
+
+        Args:
+            text: Текст сообщения клиента
+
+        Returns:
+            bool | None: False — ответ не нужен, True — нужен,
+                         None — неоднозначно, решает GPT
+        """
+        self.total += 1
+        verdict = self._classify(text)
+
+        if verdict is False:
+            self.no_answer += 1
+        elif verdict is True:
+            self.answer += 1
+        return verdict
+
+    @staticmethod
+    def _classify(text: str) -> bool | None:
+        text = (text or "").strip().lower().replace("ё", "е")
+
+        # Явный вопрос — ответ нужен (в т.ч. голое "?" / "???" — клиент напоминает)
+        if "?" in text:
+            return True
+
+        # Только эмодзи / знаки препинания — ответ не нужен
+        if not _MEANINGFUL_RE.search(text) and "+" not in text:
+            return False
+
+        words = _WORD_RE.findall(text)
+        if 0 < len(words) <= MAX_ACK_WORDS and all(word in ACK_WORDS for word in words):
+            return False
+
+        return None
+
+    def stats(self) -> dict:
+        """Статистика: сколько решено без GPT."""
+        decided = self.no_answer + self.answer
+        return {
+            "total": self.total,
+            "no_answer": self.no_answer,
+            "answer": self.answer,
+            "to_gpt": self.total - decided,
+            "hit_rate": decided / self.total if self.total else 0.0,
+        }
+
+
+# Глобальный экземпляр
+need_answer_prefilter = NeedAnswerPrefilter()
@@ -0,0 +1,72 @@
+"""
+Индекс открытых обращений клиентов.
+
+Держит в памяти по каждому чату сообщения клиентов со status='waiting',
+чтобы закрывать их сразу, как только ответит проджект, без опроса БД.
+Синхронизируется с chat_log: наполняется при старте и при постановке
+в ожидание, очищается при ответе и финальной эскалации.
+"""
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class OpenThreadsIndex:
+    """Открытые обращения: chat_id -> {log_id: message_id}."""
+
+    def __init__(self):
+        self._threads: dict[str, dict[int, int]] = {}
+
+    def add(self, chat_id: str, log_id: int, message_id: int) -> None:
+        """Добавляет ожидающее ответа сообщение."""
+        self._threads.setdefault(str(chat_id), {})[int(log_id)] = int(message_id)
+
+    def remove(self, chat_id: str, log_id: int) -> None:
+        """Убирает сообщение из индекса."""
+        chat_threads = self._threads.get(str(chat_id))
+        if not chat_threads:
+            return
+        chat_threads.pop(int(log_id), None)
+        if not chat_threads:
+            self._threads.pop(str(chat_id), None)
+
+    def pop_answered(self, chat_id: str, answer_message_id: int) -> dict[int, int]:
+        """
+        Забирает все открытые сообщения чата, написанные до ответа проджекта.
+
+        Args:
+            chat_id: ID чата
+            answer_message_id: message_id ответа проджекта
+
+        Returns:
+            dict[int, int]: log_id -> message_id закрытых сообщений
+        """
+        chat_threads = self._threads.get(str(chat_id))
+        if not chat_threads:
+            return {}
+
+        answered = {
+            log_id: message_id for log_id, message_id in chat_threads.items()
+            if message_id < answer_message_id
+        }
+        for log_id in answered:
+            del chat_threads[log_id]
+        if not chat_threads:
+            self._threads.pop(str(chat_id), None)
+
+        return answered
+
+    def load(self, rows: list[dict]) -> None:
+        """Наполняет индекс записями chat_log со status='waiting'."""
+        for row in rows:
+            self.add(row["chat_id"], row["id"], row["message_id"])
+        logger.info(f"Открытых обращений в индексе: {len(self)}")
+
+    def __len__(self) -> int:
+        return sum(len(threads) for threads in self._threads.values())
+
+
+# Глобальный экземпляр
+open_threads = OpenThreadsIndex()
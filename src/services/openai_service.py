@@ -4,35 +4,117 @@
 Все вызовы GPT собраны в одном месте с единой обработкой ошибок.
 """
 
-from openai import OpenAI
+import asyncio
+
+from openai import AsyncOpenAI
 
 from src.config import settings
 from src.config.settings import TONE_OF_VOICE
+from src.services.response_cache import MISSING, response_cache
 from src.utils.logging import get_logger
 
 
 logger = get_logger(__name__)
 
+# Критерии договорённости для analyze_project_message
+COMMITMENT_RULES = """Ты анализируешь ОДНО КОНКРЕТНОЕ сообщение проджект-менеджера.
+Определи, содержит ли ИМЕННО ЭТО СООБЩЕНИЕ конкретное обещание/договорённость.
+
+ВАЖНО: Анализируй ТОЛЬКО переданное сообщение! Не выдумывай обещания, которых нет в тексте!
+
+✅ ЭТО ОБЕЩАНИЯ (нужно напомнить):
+- "Завтра пришлю отчёт" → да, deadline_type: "date", deadline_date: завтрашняя дата
+- "Созвонимся в понедельник" → да, deadline_type: "date", deadline_date: дата понедельника
+- "До вторника сделаю" → да, deadline_type: "date", deadline_date: дата вторника
+- "Сделаю на этой неделе" → да, deadline_type: "date", deadline_date: пятница этой недели
+- "Завтра в 13:00 созвон" → да, deadline_type: "date", deadline_date: завтра, deadline_time: "13:00"
+- "Уточню у команды и вернусь" → да, deadline_type: "hours", remind_in_hours: 4
+- "Посмотрю сегодня" → да, deadline_type: "date", deadline_date: сегодня
+- "В течение часа отправлю" → да, deadline_type: "hours", remind_in_hours: 1
+- "В течение 2 часов пришлю" → да, deadline_type: "hours", remind_in_hours: 2
+- "В течение дня сделаю" → да, deadline_type: "hours", remind_in_hours: 8
+
+❌ ЭТО НЕ ОБЕЩАНИЯ (НЕ нужно напоминать):
+- "Ок, принял" → нет
+- "Спасибо за информацию" → нет
+- "Привет! Как дела?" → нет
+- "а потом /client" → нет, это инструкция/команда
+- "напиши ей /help" → нет, это инструкция другому человеку
+- "потом расскажу" → нет, слишком неопределённо
+- "да", "нет", "ок", "понял" → нет, это просто подтверждение
+- Команды боту (/help, /client, /digest) → нет
+- Инструкции коллегам → нет
+- "Можем скорректировать, если нужно" → нет, это ПРЕДЛОЖЕНИЕ, а не обещание
+- "Если что — обращайтесь" → нет, условное предложение
+- "При необходимости сделаем" → нет, это возможность, не обязательство
+- "Могу прислать позже" → нет, это предложение без обязательства
+- "Сейчас посмотрю" → нет, это текущее действие, не будущее обязательство
+- Любые короткие фразы без ЯВНОГО указания КОГДА и ЧТО будет сделано → нет
+
+КРИТЕРИИ НАСТОЯЩЕГО ОБЕЩАНИЯ (должны быть ВСЕ):
+1. Есть КОНКРЕТНОЕ ДЕЙСТВИЕ (пришлю, сделаю, позвоню, отправлю)
+2. Есть УКАЗАНИЕ ВРЕМЕНИ (завтра, через час, на неделе, сегодня вечером, до вторника)
+3. Это ОБЯЗАТЕЛЬСТВО, а не предложение или констатация
+4. Адресовано КЛИЕНТУ (не коллеге, не боту)
+
+Если хотя бы ОДИН критерий не выполнен — это НЕ обещание!
+
+ВАЖНО: Лучше пропустить обещание, чем создать ложное напоминание!"""
+
+# Поля client_knowledge, которые можно пополнять из сообщений проджекта
+CLIENT_FACT_FIELDS = (
+    "decision_maker", "contact_person", "preferences", "dislikes",
+    "communication_style", "best_contact_time", "service_type",
+)
+
+COMMITMENT_DEADLINE_RULES = """ПРАВИЛА ОПРЕДЕЛЕНИЯ ДЕДЛАЙНА:
+- Если указан ДЕНЬ ("завтра", "в понедельник", "до вторника", "на этой неделе"):
+  → deadline_type: "date"
+  → deadline_date: конкретная дата в формате YYYY-MM-DD
+  → deadline_time: указанное время или null (по умолчанию напомним в 17:00)
+
+- Если указано ОТНОСИТЕЛЬНОЕ ВРЕМЯ ("через час", "в течение 2 часов", "скоро"):
+  → deadline_type: "hours"
+  → remind_in_hours: количество часов
+
+- "сегодня" без времени → deadline_type: "date", deadline_date: текущая дата, deadline_time: null
+- "завтра" без времени → deadline_type: "date", deadline_date: завтрашняя дата, deadline_time: null
+- "до вторника" → deadline_type: "date", deadline_date: дата вторника, deadline_time: null
+- "в 13:00" или "к 15:00" → добавь deadline_time"""
+
+
 
 class OpenAIService:
     """Сервис для работы с OpenAI API."""
 
     def __init__(self):
-        self._client: OpenAI | None = None
+        self._client: AsyncOpenAI | None = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
 
     @property
-    def client(self) -> OpenAI:
+    def client(self) -> AsyncOpenAI:
         """Ленивая инициализация клиента."""
         if self._client is None:
-            self._client = OpenAI(api_key=settings.openai_api_key)
+            self._client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout,
+            )
         return self._client
 
-    def _call_gpt(
+    def _get_semaphore(self, model: str) -> asyncio.Semaphore:
+        """Семафор, ограничивающий число параллельных запросов к модели."""
+        if model not in self._semaphores:
+            limit = settings.openai_model_concurrency.get(model, settings.openai_max_concurrency)
+            self._semaphores[model] = asyncio.Semaphore(limit)
+        return self._semaphores[model]
+
+    async def _call_gpt(
         self,
         system_prompt: str,
         user_content: str,
         max_tokens: int = 300,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        model: str | None = None
     ) -> str:
         """
         Базовый вызов GPT.
@@ -42,20 +124,24 @@ class OpenAIService:
             user_content: Сообщение пользователя
             max_tokens: Максимум токенов в ответе
             temperature: Температура генерации
+            model: Модель (по умолчанию settings.openai_model)
 
         Returns:
             str: Ответ GPT или пустая строка при ошибке
         """
+        model = model or settings.openai_model
+
         try:
-            response = self.client.chat.completions.create(
-                model=settings.openai_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content},
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
+            async with self._get_semaphore(model):
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content},
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
             return (response.choices[0].message.content or "").strip()
         except Exception as e:
             logger.error(f"GPT call error: {e}")
@@ -72,6 +158,11 @@ class OpenAIService:
         Returns:
             bool: True если нужен ответ
         """
+        cache_key = response_cache.make_key("need_answer", text, context)
+        cached = response_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+
         user_content = text or ""
         if context:
             user_content = f"Контекст (предыдущие сообщения):\n{context}\n\nНовое сообщение клиента:\n{text}"
@@ -85,8 +176,90 @@ class OpenAIService:
             "нужен ответ только на ПОСЛЕДНЕЕ сообщение в цепочке."
         )
 
-        result = self._call_gpt(system_prompt, user_content, max_tokens=1)
-        return result == "1"
+        result = await self._call_gpt(system_prompt, user_content, max_tokens=1)
+        need_answer = result == "1"
+        # Ошибку GPT (пустой ответ) не кэшируем
+        if result in ("0", "1"):
+            response_cache.set(cache_key, need_answer)
+        return need_answer
+
+    async def check_if_need_answer_batch(self, items: list[tuple[str, str]]) -> list[bool]:
+        """
+        Проверяет пачку сообщений клиентов одним вызовом GPT.
+
+        Args:
+            items: Список пар (текст сообщения, контекст)
+
+        Returns:
+            list[bool]: Для каждого сообщения — нужен ли ответ (в том же порядке)
+        """
+        if not items:
+            return []
+
+        # Уже классифицированные сообщения берём из кэша
+        keys = [response_cache.make_key("need_answer", text, context) for text, context in items]
+        results = [response_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is MISSING]
+
+        if missing:
+            classified = await self._classify_need_answer_batch([items[i] for i in missing])
+            for i, need_answer in zip(missing, classified):
+                results[i] = need_answer
+
+        return results
+
+    async def _classify_need_answer_batch(self, items: list[tuple[str, str]]) -> list[bool]:
+        """Классифицирует пачку одним вызовом GPT (без кэша на входе)."""
+        if len(items) == 1:
+            return [await self.check_if_need_answer(*items[0])]
+
+        blocks = []
+        for i, (text, context) in enumerate(items, 1):
+            block = f"### Сообщение {i}\n"
+            if context:
+                block += f"Контекст (предыдущие сообщения):\n{context}\n\n"
+            block += f"Новое сообщение клиента:\n{text}"
+            blocks.append(block)
+
+        system_prompt = (
+            "Тебе дан список НЕЗАВИСИМЫХ сообщений клиентов из разных чатов, у каждого свой контекст.\n"
+            "Для каждого определи, нужно ли отвечать на НОВОЕ сообщение клиента, учитывая его контекст:\n"
+            "1 — если это вопрос/просьба/проблема/продолжение темы\n"
+            "0 — если это просто 'ок', 'спасибо', эмодзи\n\n"
+            "ВАЖНО: Если клиент пишет несколько сообщений подряд (развивая мысль) - это ОДНА просьба, "
+            "нужен ответ только на ПОСЛЕДНЕЕ сообщение в цепочке.\n\n"
+            f"Верни СТРОГО JSON-массив из {len(items)} чисел 0 или 1 в порядке сообщений, "
+            "без пояснений. Например: [1, 0, 1]"
+        )
+
+        result = await self._call_gpt(
+            system_prompt,
+            "\n\n".join(blocks),
+            max_tokens=4 * len(items) + 10
+        )
+
+        try:
+            import json
+            result = result.strip()
+            if result.startswith("```"):
+                result = result.split("```")[1]
+                if result.startswith("json"):
+                    result = result[4:]
+            result = result.strip()
+
+            data = json.loads(result)
+            if not isinstance(data, list) or len(data) != len(items):
+                raise ValueError(f"expected {len(items)} items")
+            results = [str(x).strip() == "1" for x in data]
+            for (text, context), need_answer in zip(items, results):
+                response_cache.set(response_cache.make_key("need_answer", text, context), need_answer)
+            return results
+        except Exception as e:
+            logger.error(f"Error parsing need-answer batch: {e}, result: {result}")
+            # Фолбэк: классифицируем по одному
+            return list(await asyncio.gather(
+                *(self.check_if_need_answer(text, context) for text, context in items)
+            ))
 
     async def generate_suggestion_and_tasks(
         self,
@@ -121,7 +294,7 @@ class OpenAIService:
             "- <задача 2>"
         )
 
-        text = self._call_gpt(system_prompt, user_content)
+        text = await self._call_gpt(system_prompt, user_content)
 
         # Парсим ответ
         reply = ""
@@ -179,7 +352,7 @@ class OpenAIService:
             "ДРУЖЕЛЮБНЫЙ:\n<текст>\n\n"
         )
 
-        text = self._call_gpt(system_prompt, user_content, max_tokens=500)
+        text = await self._call_gpt(system_prompt, user_content, max_tokens=500)
 
         # Парсим
         variants = []
@@ -199,7 +372,8 @@ class OpenAIService:
     async def generate_holiday_greeting(
         self,
         holiday_name: str,
-        chat_name: str
+        chat_name: str,
+        with_fallback: bool = True
     ) -> str:
         """
         Генерирует персонализированное поздравление с праздником.
@@ -207,9 +381,10 @@ class OpenAIService:
         Args:
             holiday_name: Название праздника
             chat_name: Название чата (для контекста сферы клиента)
+            with_fallback: Подставить шаблонное поздравление, если GPT не ответил
 
         Returns:
-            str: Текст поздравления
+            str: Текст поздравления (пустая строка при ошибке и with_fallback=False)
         """
         system_prompt = (
             "Ты помощник проджект-менеджера маркетингового агентства.\n"
@@ -225,9 +400,9 @@ class OpenAIService:
 
         user_content = f"Праздник: {holiday_name}\nКлиент/чат: {chat_name}"
 
-        result = self._call_gpt(system_prompt, user_content, max_tokens=200)
+        result = await self._call_gpt(system_prompt, user_content, max_tokens=200)
 
-        if not result:
+        if not result and with_fallback:
             result = f"🎉 Поздравляем с праздником — {holiday_name}! Желаем успехов, вдохновения и отличного настроения!"
 
         return result
@@ -278,7 +453,7 @@ class OpenAIService:
 6. Если в истории видно имя клиента — можешь обратиться по имени
 """
 
-        return self._call_gpt(system_prompt, context, max_tokens=300)
+        return await self._call_gpt(system_prompt, context, max_tokens=300)
 
     async def generate_upsell_suggestion(
         self,
@@ -324,7 +499,7 @@ class OpenAIService:
 СООБЩЕНИЕ:
 [готовый текст для отправки клиенту]"""
 
-        return self._call_gpt(
+        return await self._call_gpt(
             "Ты опытный аккаунт-менеджер маркетингового агентства.",
             prompt,
             max_tokens=500
@@ -406,128 +581,88 @@ class OpenAIService:
 - Если информации мало — пиши "Недостаточно данных"
 - Не выдумывай то, чего нет в переписке"""
 
-        result = self._call_gpt(system_prompt, conversation_text, max_tokens=800, temperature=0.5)
+        result = await self._call_gpt(system_prompt, conversation_text, max_tokens=800, temperature=0.5)
 
         if not result:
             result = "❌ Не удалось сгенерировать дайджест. Попробуйте позже."
 
         return result
 
-    async def extract_commitment(
+    async def analyze_project_message(
         self,
         message_text: str,
-        context: str = ""
-    ) -> dict | None:
+        known_facts: dict | None = None
+    ) -> dict:
         """
-        Извлекает договорённость/обещание из сообщения проджекта.
+        Разбирает сообщение проджекта одним вызовом GPT: договорённость
+        и новые факты о клиенте для базы знаний.
 
         Args:
             message_text: Текст сообщения проджекта
-            context: Контекст диалога
+            known_facts: Уже известные поля базы знаний (чтобы не повторять)
 
         Returns:
-            dict | None: {
-                "has_commitment": bool,
-                "text": str,  # Краткое описание договорённости
-                "deadline_type": "date" | "hours",  # Тип дедлайна
-                "deadline_date": "YYYY-MM-DD" | null,  # Конкретная дата (если указан день)
-                "deadline_time": "HH:MM" | null,  # Время (если указано)
-                "remind_in_hours": int  # Через сколько часов (для относительных сроков)
+            dict: {
+                "commitment": dict | None,  # has_commitment, text, deadline_*, remind_in_hours
+                "client_facts": dict  # новые поля из CLIENT_FACT_FIELDS
             }
         """
-        from datetime import datetime
+        import json
         from src.utils.time_utils import now_local
 
-        # Получаем текущую дату и день недели для контекста
         now = now_local()
         weekday_names = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
         current_weekday = weekday_names[now.weekday()]
 
-        # Контекст НЕ передаём — анализируем ТОЛЬКО текущее сообщение
-        # Иначе GPT находит обещания из контекста и приписывает их текущему сообщению
-        user_content = f"Сообщение для анализа:\n{message_text}\n\nТекущая дата: {now.strftime('%Y-%m-%d')} ({current_weekday})"
-
-        system_prompt = """Ты анализируешь ОДНО КОНКРЕТНОЕ сообщение проджект-менеджера.
-Определи, содержит ли ИМЕННО ЭТО СООБЩЕНИЕ конкретное обещание/договорённость.
-
-ВАЖНО: Анализируй ТОЛЬКО переданное сообщение! Не выдумывай обещания, которых нет в тексте!
-
-✅ ЭТО ОБЕЩАНИЯ (нужно напомнить):
-- "Завтра пришлю отчёт" → да, deadline_type: "date", deadline_date: завтрашняя дата
-- "Созвонимся в понедельник" → да, deadline_type: "date", deadline_date: дата понедельника
-- "До вторника сделаю" → да, deadline_type: "date", deadline_date: дата вторника
-- "Сделаю на этой неделе" → да, deadline_type: "date", deadline_date: пятница этой недели
-- "Завтра в 13:00 созвон" → да, deadline_type: "date", deadline_date: завтра, deadline_time: "13:00"
-- "Уточню у команды и вернусь" → да, deadline_type: "hours", remind_in_hours: 4
-- "Посмотрю сегодня" → да, deadline_type: "date", deadline_date: сегодня
-- "В течение часа отправлю" → да, deadline_type: "hours", remind_in_hours: 1
-- "В течение 2 часов пришлю" → да, deadline_type: "hours", remind_in_hours: 2
-- "В течение дня сделаю" → да, deadline_type: "hours", remind_in_hours: 8
+        known = {k: v for k, v in (known_facts or {}).items() if k in CLIENT_FACT_FIELDS and v}
+        known_text = json.dumps(known, ensure_ascii=False) if known else "ничего"
 
-❌ ЭТО НЕ ОБЕЩАНИЯ (НЕ нужно напоминать):
-- "Ок, принял" → нет
-- "Спасибо за информацию" → нет
-- "Привет! Как дела?" → нет
-- "а потом /client" → нет, это инструкция/команда
-- "напиши ей /help" → нет, это инструкция другому человеку
-- "потом расскажу" → нет, слишком неопределённо
-- "да", "нет", "ок", "понял" → нет, это просто подтверждение
-- Команды боту (/help, /client, /digest) → нет
-- Инструкции коллегам → нет
-- "Можем скорректировать, если нужно" → нет, это ПРЕДЛОЖЕНИЕ, а не обещание
-- "Если что — обращайтесь" → нет, условное предложение
-- "При необходимости сделаем" → нет, это возможность, не обязательство
-- "Могу прислать позже" → нет, это предложение без обязательства
-- "Сейчас посмотрю" → нет, это текущее действие, не будущее обязательство
-- Любые короткие фразы без ЯВНОГО указания КОГДА и ЧТО будет сделано → нет
+        cache_key = response_cache.make_key(
+            "project_analysis", message_text, now.strftime('%Y-%m-%d'), known_text
+        )
+        cached = response_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
 
-КРИТЕРИИ НАСТОЯЩЕГО ОБЕЩАНИЯ (должны быть ВСЕ):
-1. Есть КОНКРЕТНОЕ ДЕЙСТВИЕ (пришлю, сделаю, позвоню, отправлю)
-2. Есть УКАЗАНИЕ ВРЕМЕНИ (завтра, через час, на неделе, сегодня вечером, до вторника)
-3. Это ОБЯЗАТЕЛЬСТВО, а не предложение или констатация
-4. Адресовано КЛИЕНТУ (не коллеге, не боту)
+        user_content = f"Сообщение для анализа:\n{message_text}\n\nТекущая дата: {now.strftime('%Y-%m-%d')} ({current_weekday})"
 
-Если хотя бы ОДИН критерий не выполнен — это НЕ обещание!
+        system_prompt = f"""{COMMITMENT_RULES}
 
-ВАЖНО: Лучше пропустить обещание, чем создать ложное напоминание!
+ДОПОЛНИТЕЛЬНО: выпиши факты о клиенте, которые ЯВНО сказаны в этом сообщении
+(кто ЛПР, контактное лицо, что клиенту нравится/не нравится, стиль общения,
+удобное время связи, тип услуги). Не додумывай. Уже известно: {known_text}
+Включай только НОВЫЕ или ИЗМЕНИВШИЕСЯ факты.
 
 Ответь СТРОГО в формате JSON:
-{
-  "has_commitment": true/false,
-  "text": "краткое описание",
-  "deadline_type": "date" или "hours",
-  "deadline_date": "YYYY-MM-DD" или null,
-  "deadline_time": "HH:MM" или null,
-  "remind_in_hours": число или null
-}
-
-ПРАВИЛА ОПРЕДЕЛЕНИЯ ДЕДЛАЙНА:
-- Если указан ДЕНЬ ("завтра", "в понедельник", "до вторника", "на этой неделе"):
-  → deadline_type: "date"
-  → deadline_date: конкретная дата в формате YYYY-MM-DD
-  → deadline_time: указанное время или null (по умолчанию напомним в 17:00)
-
-- Если указано ОТНОСИТЕЛЬНОЕ ВРЕМЯ ("через час", "в течение 2 часов", "скоро"):
-  → deadline_type: "hours"
-  → remind_in_hours: количество часов
-
-- "сегодня" без времени → deadline_type: "date", deadline_date: текущая дата, deadline_time: null
-- "завтра" без времени → deadline_type: "date", deadline_date: завтрашняя дата, deadline_time: null
-- "до вторника" → deadline_type: "date", deadline_date: дата вторника, deadline_time: null
-- "в 13:00" или "к 15:00" → добавь deadline_time
+{{
+  "commitment": {{
+    "has_commitment": true/false,
+    "text": "краткое описание",
+    "deadline_type": "date" или "hours",
+    "deadline_date": "YYYY-MM-DD" или null,
+    "deadline_time": "HH:MM" или null,
+    "remind_in_hours": число или null
+  }},
+  "client_facts": {{
+    "decision_maker": "ЛПР (имя, должность)",
+    "contact_person": "контактное лицо",
+    "preferences": "что нравится, важно",
+    "dislikes": "что не нравится",
+    "communication_style": "формальный/дружеский/деловой",
+    "best_contact_time": "удобное время связи",
+    "service_type": "geo/context/site/serm"
+  }}
+}}
+В client_facts — только поля с фактами из сообщения, иначе пустой объект {{}}.
 
-Если обещания нет, верни:
-{"has_commitment": false, "text": "", "deadline_type": null, "deadline_date": null, "deadline_time": null, "remind_in_hours": null}"""
+{COMMITMENT_DEADLINE_RULES}"""
 
-        result = self._call_gpt(system_prompt, user_content, max_tokens=100, temperature=0.3)
+        result = await self._call_gpt(system_prompt, user_content, max_tokens=250, temperature=0.3)
 
         if not result:
-            return None
+            return {"commitment": None, "client_facts": {}}
 
-        # Парсим JSON
         try:
-            import json
-            # Очищаем от возможных markdown-обёрток
             result = result.strip()
             if result.startswith("```"):
                 result = result.split("```")[1]
@@ -536,12 +671,22 @@ class OpenAIService:
             result = result.strip()
 
             data = json.loads(result)
-            if data.get("has_commitment"):
-                return data
-            return None
+            commitment = data.get("commitment") or {}
+            facts = data.get("client_facts") or {}
+
+            analysis = {
+                "commitment": commitment if commitment.get("has_commitment") else None,
+                "client_facts": {
+                    k: v.strip() for k, v in facts.items()
+                    if k in CLIENT_FACT_FIELDS and isinstance(v, str) and v.strip()
+                    and v.strip() != known.get(k)
+                },
+            }
+            response_cache.set(cache_key, analysis)
+            return analysis
         except Exception as e:
-            logger.error(f"Error parsing commitment: {e}, result: {result}")
-            return None
+            logger.error(f"Error parsing project message analysis: {e}, result: {result}")
+            return {"commitment": None, "client_facts": {}}
 
     async def extract_client_info_from_history(
         self,
@@ -593,7 +738,7 @@ class OpenAIService:
 - Пиши кратко, по делу
 - client_name извлеки из названия чата или переписки"""
 
-        result = self._call_gpt(system_prompt, conversation_text, max_tokens=400, temperature=0.3)
+        result = await self._call_gpt(system_prompt, conversation_text, max_tokens=400, temperature=0.3)
 
         if not result:
             return {}
@@ -687,7 +832,7 @@ class OpenAIService:
 - Имя клиента ищи по частичному совпадению в списке доступных
 - Для напоминаний ОБЯЗАТЕЛЬНО заполни reminder_text и remind_in_hours"""
 
-        result = self._call_gpt(system_prompt, f"Пользователь {user_name} пишет: {user_message}", max_tokens=300, temperature=0.7)
+        result = await self._call_gpt(system_prompt, f"Пользователь {user_name} пишет: {user_message}", max_tokens=300, temperature=0.7)
 
         if not result:
             return {
@@ -808,7 +953,7 @@ class OpenAIService:
 
 Сгенерируй план-факт отчёт."""
 
-        result = self._call_gpt(system_prompt, user_content, max_tokens=1500, temperature=0.6)
+        result = await self._call_gpt(system_prompt, user_content, max_tokens=1500, temperature=0.6)
 
         if not result:
             return None
@@ -848,6 +993,11 @@ class OpenAIService:
 
         # Ограничиваем длину транскрипции
         max_chars = 30000  # ~7500 токенов
+
+        # Длинную встречу разбираем по частям, чтобы не терять середину
+        if len(transcript) > max_chars and settings.meeting_summary_mode == "map_reduce":
+            return await self._summarize_meeting_map_reduce(transcript, meeting_context)
+
         if len(transcript) > max_chars:
             # Берём начало и конец
             half = max_chars // 2
@@ -888,7 +1038,7 @@ class OpenAIService:
 8. Если встреча на русском — пиши саммари на русском
 9. Не выдумывай информацию, которой нет в транскрипции!"""
 
-        result = self._call_gpt(
+        result = await self._call_gpt(
             system_prompt,
             f"ТРАНСКРИПЦИЯ ВСТРЕЧИ:\n\n{transcript}",
             max_tokens=2000,
@@ -934,5 +1084,161 @@ class OpenAIService:
             }
 
 
+    @staticmethod
+    def _split_transcript(transcript: str, chunk_chars: int) -> list[str]:
+        """Режет транскрипцию на части до chunk_chars по границам абзацев и слов."""
+        chunk_chars = max(1, chunk_chars)
+        chunks = []
+        rest = transcript.strip()
+
+        while len(rest) > chunk_chars:
+            cut = rest.rfind("\n", 0, chunk_chars)
+            if cut < chunk_chars // 2:
+                cut = rest.rfind(" ", 0, chunk_chars)
+            if cut < chunk_chars // 2:
+                cut = chunk_chars
+            chunks.append(rest[:cut].strip())
+            rest = rest[cut:].strip()
+
+        if rest:
+            chunks.append(rest)
+        return chunks
+
+    @staticmethod
+    def _parse_summary_json(result: str) -> dict | None:
+        """Разбирает JSON-ответ саммари (в том числе в ```json-блоке)."""
+        try:
+            import json
+            result = result.strip()
+            if result.startswith("```"):
+                result = result.split("```")[1]
+                if result.startswith("json"):
+                    result = result[4:]
+            data = json.loads(result.strip())
+            return data if isinstance(data, dict) else None
+        except Exception:
+            return None
+
+    async def _summarize_meeting_map_reduce(self, transcript: str, meeting_context: str = "") -> dict:
+        """
+        Саммари длинной встречи в режиме map-reduce.
+
+        Map: части транскрипции суммируются параллельно в частичные JSON.
+        Reduce: один вызов объединяет их, убирая повторы.
+
+        Args:
+            transcript: Полный текст транскрипции
+            meeting_context: Контекст встречи
+
+        Returns:
+            dict: Саммари в формате generate_meeting_summary
+        """
+        import json
+
+        chunks = self._split_transcript(transcript, settings.meeting_summary_chunk_chars)
+        context_part = f"\nКонтекст встречи: {meeting_context}\n" if meeting_context else ""
+        logger.info(f"Meeting summary map-reduce: {len(chunks)} chunks")
+
+        map_prompt = f"""Ты — опытный проджект-менеджер. Перед тобой ФРАГМЕНТ транскрипции длинной встречи.
+Выдели из него всё важное — потом фрагменты объединят в общее саммари.
+{context_part}
+## Формат ответа (СТРОГО JSON):
+{{
+  "summary": "О чём шла речь в этом фрагменте, 2-3 предложения",
+  "key_points": ["Ключевой тезис"],
+  "decisions": ["Принятое решение"],
+  "tasks": [{{"text": "Текст задачи", "assignee": "Кто делает или null", "deadline": "Срок или null"}}],
+  "questions": ["Вопрос, оставшийся без ответа в этом фрагменте"]
+}}
+
+## Правила:
+1. Пиши КОНКРЕТНО, с цифрами и названиями
+2. Задачи — только явные обязательства, решения — только явно принятые
+3. Не выдумывай информацию, которой нет во фрагменте!"""
+
+        async def summarize_chunk(i: int, chunk: str) -> dict | None:
+            # Одна повторная попытка: пропавший фрагмент — пропавшая часть встречи
+            for attempt in range(1, 3):
+                result = await self._call_gpt(
+                    map_prompt,
+                    f"ФРАГМЕНТ {i + 1} ИЗ {len(chunks)}:\n\n{chunk}",
+                    max_tokens=1000,
+                    temperature=0.3
+                )
+                partial = self._parse_summary_json(result) if result else None
+                if partial is not None:
+                    return partial
+                logger.error(f"Meeting summary: chunk {i + 1}/{len(chunks)} failed (attempt {attempt}/2)")
+            return None
+
+        results = await asyncio.gather(*(
+            summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)
+        ))
+        partials = [partial for partial in results if partial]
+        missing = [i + 1 for i, partial in enumerate(results) if partial is None]
+
+        if not partials:
+            return {
+                "summary": "Не удалось проанализировать встречу",
+                "key_points": [],
+                "decisions": [],
+                "tasks": [],
+                "questions": []
+            }
+
+        reduce_prompt = f"""Ты — опытный проджект-менеджер. Ниже — саммари фрагментов одной встречи по порядку.
+Объедини их в итоговое саммари всей встречи.
+{context_part}
+## Формат ответа (СТРОГО JSON):
+{{
+  "summary": "Краткое резюме всей встречи в 3-5 предложениях",
+  "key_points": ["Ключевой тезис"],
+  "decisions": ["Принятое решение"],
+  "tasks": [{{"text": "Текст задачи", "assignee": "Кто делает или null", "deadline": "Срок или null"}}],
+  "questions": ["Открытый вопрос"]
+}}
+
+## Правила:
+1. Объединяй повторы и дубли задач, решений и тезисов
+2. Если вопрос из раннего фрагмента решён позже — убери его из questions
+3. Если решение позже пересмотрели — оставь итоговое
+4. Не добавляй ничего, чего нет во фрагментах!"""
+
+        result = await self._call_gpt(
+            reduce_prompt,
+            "САММАРИ ФРАГМЕНТОВ:\n\n" + json.dumps(partials, ensure_ascii=False),
+            max_tokens=2000,
+            temperature=0.3
+        )
+        data = self._parse_summary_json(result) if result else None
+
+        if data is None:
+            # Reduce не удался — склеиваем частичные саммари как есть
+            logger.error("Meeting summary: reduce step failed, merging partials")
+            data = {
+                "summary": " ".join(p.get("summary", "") for p in partials),
+                "key_points": [x for p in partials for x in p.get("key_points", [])],
+                "decisions": [x for p in partials for x in p.get("decisions", [])],
+                "tasks": [x for p in partials for x in p.get("tasks", [])],
+                "questions": [x for p in partials for x in p.get("questions", [])],
+            }
+
+        summary = data.get("summary", "")
+        if missing:
+            # Не выдаём неполное саммари за полное
+            summary = (
+                f"⚠️ Не удалось разобрать фрагменты {', '.join(map(str, missing))} "
+                f"из {len(chunks)} — саммари неполное.\n\n{summary}"
+            )
+
+        return {
+            "summary": summary,
+            "key_points": data.get("key_points", []),
+            "decisions": data.get("decisions", []),
+            "tasks": data.get("tasks", []),
+            "questions": data.get("questions", [])
+        }
+
+
 # Глобальный экземпляр
 ai_service = OpenAIService()
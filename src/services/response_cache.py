@@ -0,0 +1,137 @@
+"""
+Кэш ответов GPT для детерминированных классификаторов.
+
+Короткие повторяющиеся сообщения ("спасибо", "ок", пересланный текст)
+не должны каждый раз стоить запроса к GPT. Ключ — хэш нормализованного
+текста и контекста, записи живут TTL и вытесняются по LRU.
+При заданном RESPONSE_CACHE_PATH кэш переживает рестарт (JSON на диске).
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from src.config import settings
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+# Признак промаха: None — тоже валидный закэшированный ответ
+MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к виду для ключа: нижний регистр, одиночные пробелы."""
+    return " ".join((text or "").lower().split())
+
+
+class ResponseCache:
+    """LRU-кэш с TTL и опциональным сохранением на диск."""
+
+    def __init__(self, max_size: int, ttl: int, path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(namespace: str, *parts: str) -> str:
+        """
+        Ключ кэша из пространства имён и частей входа.
+
+        Args:
+            namespace: Имя классификатора ("need_answer", "commitment")
+            parts: Текст, контекст и т.п. — нормализуются перед хэшированием
+
+        Returns:
+            str: namespace:sha256
+        """
+        digest = hashlib.sha256(
+            "\x1f".join(normalize_text(part) for part in parts).encode("utf-8")
+        ).hexdigest()
+        return f"{namespace}:{digest}"
+
+    def get(self, key: str) -> Any:
+        """Возвращает значение или MISSING."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        """Сохраняет значение (должно сериализоваться в JSON)."""
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Статистика: размер, попадания, промахи."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def load(self) -> None:
+        """Загружает непросроченные записи с диска."""
+        if not self.path or not self.path.exists():
+            return
+
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            now = time.time()
+            for key, (expires_at, value) in data.items():
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            logger.info(f"Кэш ответов GPT загружен: {len(self._entries)} записей")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки кэша ответов GPT: {e}")
+
+    def save(self) -> None:
+        """Сохраняет кэш на диск (атомарно, через временный файл)."""
+        if not self.path:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            now = time.time()
+            data = {
+                key: [expires_at, value]
+                for key, (expires_at, value) in self._entries.items()
+                if expires_at > now
+            }
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            logger.info(f"Кэш ответов GPT сохранён: {len(data)} записей")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша ответов GPT: {e}")
+
+
+# Глобальный экземпляр
+response_cache = ResponseCache(
+    max_size=settings.response_cache_size,
+    ttl=settings.response_cache_ttl,
+    path=settings.response_cache_path,
+)
@@ -8,15 +8,17 @@
 - Ежемесячная допродажа (1 числа в 10:00)
 """
 
-from datetime import datetime, timezone
+import asyncio
+from datetime import datetime, timedelta, timezone
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from src.config import settings, HOLIDAYS
-from src.core import db, bot
+from src.core import async_db, bot, chat_activity, send_message_throttled
 from src.services.openai_service import ai_service
 from src.utils.logging import get_logger
-from src.utils.time_utils import now_local, is_work_time, is_holiday
+from src.utils.rate_limit import RateLimiter
+from src.utils.time_utils import now_local, parse_timestamp, is_work_time, is_holiday
 from src.webhooks.bitrix import send_to_chat
 
 
@@ -75,6 +77,15 @@ class SchedulerService:
         )
         logger.info("Допродажа: 1 числа каждого месяца в 10:00")
 
+        # Возобновление прерванной допродажи после рестарта
+        self.scheduler.add_job(
+            self.resume_monthly_upsell_job,
+            "date",
+            run_date=datetime.now(timezone.utc) + timedelta(seconds=30),
+            id="monthly_upsell_resume",
+            replace_existing=True
+        )
+
         # Проверка напоминаний о договорённостях — каждые 15 минут
         self.scheduler.add_job(
             self.check_reminders_job,
@@ -113,47 +124,54 @@ class SchedulerService:
             return
 
         try:
-            chats = db.get_all_chat_owners()
+            chats = await async_db.get_all_chat_owners()
+            chats = [c for c in chats if c.get("chat_id") and c.get("project_id")]
             if not chats:
                 logger.info("Нет чатов для проверки")
                 return
 
             today_start = today.replace(hour=0, minute=0, second=0, microsecond=0)
-            today_start_iso = today_start.isoformat()
 
+            # Последнее сообщение по чатам: из памяти, иначе одним запросом к БД
+            if chat_activity.loaded:
+                last_activity = {str(c["chat_id"]): chat_activity.get(c["chat_id"]) for c in chats}
+            else:
+                activity = await async_db.get_last_activity([str(c["chat_id"]) for c in chats])
+                if activity is None:
+                    logger.error("Активность по чатам не получена, проверка пропущена")
+                    return
+                last_activity = {chat_id: parse_timestamp(ts) for chat_id, ts in activity.items()}
+
+            inactive = []
             for chat in chats:
-                chat_id = chat.get("chat_id")
                 chat_name = chat.get("chat_name", "Unknown")
-                project_id = chat.get("project_id")
-                if not chat_id or not project_id:
+                last_msg_at = last_activity.get(str(chat["chat_id"]))
+
+                if last_msg_at and last_msg_at >= today_start:
+                    logger.info(f"{chat_name}: сегодня есть активность")
                     continue
-                try:
-                    # Проверяем: были ли сообщения СЕГОДНЯ
-                    messages = db.get_recent_messages(chat_id, 999999999, 1)
 
-                    has_activity_today = False
-                    if messages:
-                        # Проверяем timestamp последнего сообщения
-                        last_msg_ts = messages[0].get("timestamp", "")
-                        if last_msg_ts >= today_start_iso:
-                            has_activity_today = True
+                logger.info(f"{chat_name}: сегодня нет активности")
+                inactive.append(chat)
 
-                    if has_activity_today:
-                        logger.info(f"{chat_name}: сегодня есть активность")
-                        continue
+            # Рассылаем параллельно, частоту ограничивает send_message_throttled
+            await asyncio.gather(*(self._notify_inactive_chat(chat) for chat in inactive))
 
-                    # Сегодня нет сообщений — напоминаем
-                    logger.info(f"{chat_name}: сегодня нет активности")
+        except Exception as e:
+            logger.error(f"Ошибка check_inactive_chats_job: {e}")
 
-                    reminder_text = f"📢 {chat_name}: сегодня ещё не было сообщений. Напиши клиенту о ходе работы."
-                    await bot.send_message(int(project_id), reminder_text)
-                    if int(project_id) != settings.owner_id:
-                        await bot.send_message(settings.owner_id, reminder_text)
+    async def _notify_inactive_chat(self, chat: dict):
+        """Напоминает проджекту (и владельцу) о чате без активности сегодня."""
+        chat_name = chat.get("chat_name", "Unknown")
+        project_id = int(chat["project_id"])
 
-                except Exception as e:
-                    logger.error(f"Ошибка проверки чата {chat_name}: {e}")
+        try:
+            reminder_text = f"📢 {chat_name}: сегодня ещё не было сообщений. Напиши клиенту о ходе работы."
+            await send_message_throttled(project_id, reminder_text)
+            if project_id != settings.owner_id:
+                await send_message_throttled(settings.owner_id, reminder_text)
         except Exception as e:
-            logger.error(f"Ошибка check_inactive_chats_job: {e}")
+            logger.error(f"Ошибка проверки чата {chat_name}: {e}")
 
     async def check_holiday_greetings_job(self):
         """
@@ -170,7 +188,7 @@ class SchedulerService:
         logger.info(f"Сегодня праздник: {holiday_name}")
 
         try:
-            chats = db.get_all_chat_owners()
+            chats = await async_db.get_all_chat_owners()
 
             if not chats:
                 logger.info("Нет чатов для поздравлений")
@@ -185,8 +203,39 @@ class SchedulerService:
                         projects_chats[project_id] = []
                     projects_chats[project_id].append(chat)
 
+            # Генерируем поздравления параллельно, но не больше N одновременно
+            semaphore = asyncio.Semaphore(settings.holiday_greeting_concurrency)
+
+            async def generate(chat: dict) -> tuple[dict, str, bool]:
+                chat_name = chat.get("chat_name", "Unknown")
+                async with semaphore:
+                    try:
+                        greeting = await ai_service.generate_holiday_greeting(
+                            holiday_name, chat_name, with_fallback=False
+                        )
+                    except Exception as e:
+                        logger.error(f"Ошибка генерации поздравления для {chat_name}: {e}")
+                        greeting = ""
+                if greeting:
+                    return chat, greeting, True
+                fallback = f"🎉 Поздравляем с праздником — {holiday_name}! Желаем успехов, вдохновения и отличного настроения!"
+                return chat, fallback, False
+
+            results = await asyncio.gather(*(
+                generate(chat)
+                for project_chats in projects_chats.values()
+                for chat in project_chats
+            ))
+
+            greetings: dict[int, list[tuple[dict, str]]] = {}
+            failed_chats = []
+            for chat, greeting, ok in results:
+                greetings.setdefault(chat["project_id"], []).append((chat, greeting))
+                if not ok:
+                    failed_chats.append(chat.get("chat_name", "Unknown"))
+
             # Отправляем каждому проджекту напоминание
-            for project_id, project_chats in projects_chats.items():
+            async def send_to_project(project_id: int, project_greetings: list[tuple[dict, str]]) -> bool:
                 try:
                     message_parts = [
                         f"🎊 Эй, сегодня же {holiday_name}!",
@@ -196,12 +245,8 @@ class SchedulerService:
                         "",
                     ]
 
-                    for chat in project_chats:
-                        chat_name = chat.get("chat_name", "Unknown")
-
-                        greeting = await ai_service.generate_holiday_greeting(holiday_name, chat_name)
-
-                        message_parts.append(f"📌 *{chat_name}*")
+                    for chat, greeting in project_greetings:
+                        message_parts.append(f"📌 *{chat.get('chat_name', 'Unknown')}*")
                         message_parts.append(f"```\n{greeting}\n```")
                         message_parts.append("")
 
@@ -209,23 +254,41 @@ class SchedulerService:
 
                     full_message = "\n".join(message_parts)
 
-                    await bot.send_message(int(project_id), full_message, parse_mode="Markdown")
+                    await send_message_throttled(int(project_id), full_message, parse_mode="Markdown")
                     logger.info(f"Праздничное напоминание отправлено проджекту {project_id}")
+                    return True
 
                 except Exception as e:
                     logger.error(f"Ошибка отправки проджекту {project_id}: {e}")
+                    return False
+
+            sent = await asyncio.gather(*(
+                send_to_project(project_id, project_greetings)
+                for project_id, project_greetings in greetings.items()
+            ))
+            failed_projects = [
+                str(project_id) for project_id, ok in zip(greetings.keys(), sent) if not ok
+            ]
 
             # Сводка владельцу
             try:
-                total_chats = sum(len(c) for c in projects_chats.values())
+                total_chats = len(results)
                 owner_message = (
                     f"🎊 С праздником — {holiday_name}!\n\n"
                     f"Напоминания разлетелись по проджектам 🚀\n"
-                    f"Всего чатов для поздравления: {total_chats}\n\n"
-                    f"Теперь клиенты точно почувствуют заботу 💜"
+                    f"Всего чатов для поздравления: {total_chats}\n"
+                    f"Персональных поздравлений: {total_chats - len(failed_chats)}\n"
                 )
+                if failed_chats:
+                    owner_message += (
+                        f"⚠️ Шаблонный текст вместо персонального ({len(failed_chats)}): "
+                        f"{', '.join(failed_chats[:10])}\n"
+                    )
+                if failed_projects:
+                    owner_message += f"❌ Не доставлено проджектам: {', '.join(failed_projects)}\n"
+                owner_message += "\nТеперь клиенты точно почувствуют заботу 💜"
 
-                await bot.send_message(settings.owner_id, owner_message)
+                await send_message_throttled(settings.owner_id, owner_message)
             except Exception as e:
                 logger.error(f"Ошибка отправки владельцу: {e}")
 
@@ -243,7 +306,7 @@ class SchedulerService:
             return
 
         try:
-            pending = db.get_pending_nps()
+            pending = await async_db.get_pending_nps()
 
             for nps in pending:
                 try:
@@ -260,7 +323,7 @@ class SchedulerService:
                     success = await send_to_chat(chat_id, message, thread_id)
 
                     if success:
-                        db.mark_nps_sent(nps["id"])
+                        await async_db.mark_nps_sent(nps["id"])
                         logger.info(f"NPS отправлен в чат {chat_id}")
 
                 except Exception as e:
@@ -270,52 +333,145 @@ class SchedulerService:
             logger.error(f"Ошибка check_nps_queue_job: {e}")
 
     async def monthly_upsell_job(self):
-        """Ежемесячная задача допродажи - 1 числа."""
+        """
+        Ежемесячная задача допродажи - 1 числа.
+
+        Конвейер из трёх стадий:
+        1. История всех чатов (пачками по MAX_ROWS строк)
+        2. Параллельная генерация предложений (семафор + лимит частоты)
+        3. Доставка проджектам через очередь с троттлингом Telegram
+
+        Прогресс хранится в upsell_progress: при повторном запуске за тот же
+        месяц уже отправленные чаты пропускаются, сгенерированные — не
+        генерируются заново.
+        """
+        period = now_local().strftime("%Y-%m")
+
         try:
-            logger.info("Запуск ежемесячной допродажи...")
+            logger.info(f"Запуск ежемесячной допродажи за {period}...")
 
             # Получаем все чаты
-            chats = db.get_all_chat_owners()
+            chats = await async_db.get_all_chat_owners()
 
             if not chats:
                 logger.info("Нет активных чатов для допродажи")
                 return
 
+            await async_db.save_upsell_run(period, "started")
+            progress = await async_db.get_upsell_progress(period)
+            if progress is None:
+                # Без прогресса нельзя понять, кому уже отправлено, — не рискуем дублями.
+                # Запуск остаётся "started" и будет возобновлён после рестарта
+                logger.error(f"Прогресс допродажи за {period} не прочитан, запуск прерван")
+                return
+
+            targets = []
             for chat in chats:
-                try:
-                    chat_id = chat.get("chat_id")
-                    project_id = chat.get("project_id")
-                    chat_name = chat.get("chat_name", "Unknown")
+                chat_id = chat.get("chat_id")
+                if not chat_id or not chat.get("project_id"):
+                    continue
+
+                # Уже отправлено в этом месяце
+                if progress.get(str(chat_id), {}).get("status") == "sent":
+                    continue
+
+                # В чате не было ни одного сообщения — предлагать нечего
+                if chat_activity.loaded and chat_activity.get(chat_id) is None:
+                    continue
+
+                targets.append(chat)
+
+            # Стадия 1: история всех чатов пачками запросов
+            to_generate = [
+                str(chat["chat_id"]) for chat in targets
+                if not progress.get(str(chat["chat_id"]), {}).get("suggestion")
+            ]
+            histories = await async_db.get_recent_messages_for_chats(to_generate, 20)
+            if histories is None:
+                logger.error(f"История чатов для допродажи за {period} не получена, запуск прерван")
+                return
 
-                    if not chat_id or not project_id:
-                        continue
+            queue: asyncio.Queue = asyncio.Queue()
+            semaphore = asyncio.Semaphore(settings.upsell_concurrency)
+            limiter = RateLimiter(settings.upsell_rate_limit)
 
-                    # Получаем историю чата
-                    messages = db.get_recent_messages(chat_id, 999999999, 20)
+            # Стадия 2: генерация предложений
+            async def generate(chat: dict):
+                chat_id = str(chat["chat_id"])
+                chat_name = chat.get("chat_name", "Unknown")
+
+                suggestion = progress.get(chat_id, {}).get("suggestion")
+                if not suggestion:
                     chat_history = "\n".join([
-                        f"{'Проджект' if m.get('is_project') else 'Клиент'}: {m.get('text', '')[:100]}"
-                        for m in messages
+                        f"{'Проджект' if m.get('is_project') else 'Клиент'}: {(m.get('text') or '')[:100]}"
+                        for m in histories.get(chat_id, [])
                     ])
-
-                    # Генерируем предложение допродажи
                     deal = {"deal_name": chat_name, "service_type": "geo"}
-                    suggestion = await ai_service.generate_upsell_suggestion(deal, chat_history)
 
-                    if suggestion:
+                    async with semaphore:
+                        await limiter.wait()
+                        try:
+                            suggestion = await ai_service.generate_upsell_suggestion(deal, chat_history)
+                        except Exception as e:
+                            logger.error(f"Ошибка генерации допродажи для чата {chat_name}: {e}")
+                            return
+
+                    if not suggestion:
+                        return
+
+                    await async_db.save_upsell_progress(
+                        period, chat_id, "generated",
+                        project_id=int(chat["project_id"]),
+                        chat_name=chat_name,
+                        suggestion=suggestion,
+                    )
+
+                await queue.put((chat, suggestion))
+
+            # Стадия 3: доставка проджектам
+            async def deliver():
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+
+                    chat, suggestion = item
+                    chat_name = chat.get("chat_name", "Unknown")
+                    project_id = chat["project_id"]
+                    try:
                         message = (
                             f"💡 Предложение допродажи\n"
                             f"📋 Клиент: {chat_name}\n\n"
                             f"{suggestion}"
                         )
-                        await bot.send_message(int(project_id), message)
+                        await send_message_throttled(int(project_id), message)
+                        await async_db.save_upsell_progress(period, str(chat["chat_id"]), "sent")
                         logger.info(f"Допродажа отправлена проджекту {project_id} для чата {chat_name}")
+                    except Exception as e:
+                        logger.error(f"Ошибка допродажи для чата {chat_name}: {e}")
 
-                except Exception as e:
-                    logger.error(f"Ошибка допродажи для чата {chat.get('chat_name')}: {e}")
+            sender = asyncio.create_task(deliver())
+            try:
+                await asyncio.gather(*(generate(chat) for chat in targets))
+            finally:
+                await queue.put(None)
+                await sender
+
+            await async_db.save_upsell_run(period, "completed")
+            logger.info(f"Допродажа за {period} завершена, чатов: {len(targets)}")
 
         except Exception as e:
             logger.error(f"Ошибка monthly_upsell_job: {e}")
 
+    async def resume_monthly_upsell_job(self):
+        """Дозапускает допродажу, если запуск этого месяца был прерван."""
+        period = now_local().strftime("%Y-%m")
+        run = await async_db.get_upsell_run(period)
+
+        if run and run.get("status") != "completed":
+            logger.info(f"Допродажа за {period} не завершена — возобновляем")
+            await self.monthly_upsell_job()
+
     async def check_reminders_job(self):
         """Проверка и отправка напоминаний о договорённостях."""
         now = now_local()
@@ -325,7 +481,7 @@ class SchedulerService:
             return
 
         try:
-            pending = db.get_pending_reminders()
+            pending = await async_db.get_pending_reminders()
 
             for reminder in pending:
                 try:
@@ -344,7 +500,7 @@ class SchedulerService:
                         message += f"\n💬 Контекст: _{context[:200]}_"
 
                     await bot.send_message(int(project_id), message, parse_mode="Markdown")
-                    db.mark_reminder_sent(reminder["id"])
+                    await async_db.mark_reminder_sent(reminder["id"])
 
                     logger.info(f"Напоминание отправлено проджекту {project_id}: {reminder_text}")
 
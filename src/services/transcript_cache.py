@@ -0,0 +1,144 @@
+"""
+Кэш транскрипций встреч на диске.
+
+Одну и ту же запись часто пересылают повторно — коллеге или после
+неудачного саммари. Транскрипция хранится по sha256 содержимого файла,
+а file_unique_id из Telegram ссылается на хэш — так повтор находится
+ещё до скачивания. Размер кэша ограничен, вытесняются давно не
+использованные записи (LRU по времени изменения файла).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+from src.config import settings
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class TranscriptCache:
+    """Дисковый LRU-кэш транскрипций."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """sha256 содержимого файла (блокирующий — вызывать через to_thread)."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _transcript_path(self, content_hash: str) -> Path:
+        return self.directory / f"{content_hash}.txt"
+
+    def _alias_path(self, file_unique_id: str) -> Path:
+        return self.directory / f"uid_{file_unique_id}.ref"
+
+    def get(self, file_unique_id: str | None = None, content_hash: str | None = None) -> str | None:
+        """
+        Ищет транскрипцию по file_unique_id или хэшу содержимого.
+
+        Args:
+            file_unique_id: Telegram file_unique_id
+            content_hash: sha256 содержимого файла
+
+        Returns:
+            str: Транскрипция или None
+        """
+        if not self.max_bytes:
+            return None
+
+        try:
+            if content_hash is None and file_unique_id:
+                alias = self._alias_path(file_unique_id)
+                if not alias.exists():
+                    return None
+                content_hash = alias.read_text(encoding="utf-8").strip()
+                os.utime(alias)
+
+            if not content_hash:
+                return None
+
+            path = self._transcript_path(content_hash)
+            if not path.exists():
+                return None
+
+            transcript = path.read_text(encoding="utf-8")
+            os.utime(path)  # Отмечаем использование для LRU
+            logger.info(f"Транскрипция из кэша: {content_hash[:12]}")
+            return transcript
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша транскрипций: {e}")
+            return None
+
+    def link(self, file_unique_id: str, content_hash: str) -> None:
+        """Связывает file_unique_id с хэшем содержимого."""
+        if not self.max_bytes or not file_unique_id:
+            return
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._alias_path(file_unique_id).write_text(content_hash, encoding="utf-8")
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш транскрипций: {e}")
+
+    def put(self, transcript: str, content_hash: str, file_unique_id: str | None = None) -> None:
+        """
+        Сохраняет транскрипцию и вытесняет старые записи сверх лимита.
+
+        Args:
+            transcript: Текст транскрипции
+            content_hash: sha256 содержимого файла
+            file_unique_id: Telegram file_unique_id (опционально)
+        """
+        if not self.max_bytes or not transcript:
+            return
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._transcript_path(content_hash).with_suffix(".tmp")
+            tmp_path.write_text(transcript, encoding="utf-8")
+            tmp_path.replace(self._transcript_path(content_hash))
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш транскрипций: {e}")
+            return
+
+        if file_unique_id:
+            self.link(file_unique_id, content_hash)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные файлы, пока кэш больше лимита."""
+        try:
+            entries = []
+            total = 0
+            for path in self.directory.iterdir():
+                if path.suffix not in (".txt", ".ref"):
+                    continue
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+        except Exception as e:
+            logger.error(f"Ошибка очистки кэша транскрипций: {e}")
+
+
+# Глобальный экземпляр
+transcript_cache = TranscriptCache(
+    directory=settings.transcript_cache_dir,
+    max_bytes=settings.transcript_cache_max_mb * 1024 * 1024,
+)
@@ -8,13 +8,15 @@
 - Транскрибация через Whisper API
 """
 
+import asyncio
 import os
-import subprocess
+import shutil
 import tempfile
 import math
 from pathlib import Path
+from typing import Awaitable, Callable
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from src.config import settings
 from src.utils.logging import get_logger
@@ -28,21 +30,67 @@ WHISPER_SIZE_LIMIT = 25 * 1024 * 1024
 # Длина части в минутах для разбивки
 CHUNK_MINUTES = 20
 
+# Общий лимит одновременно запущенных FFmpeg/ffprobe
+_ffmpeg_semaphore = asyncio.Semaphore(settings.ffmpeg_max_processes)
+
+
+async def run_ffmpeg(args: list[str], timeout: float) -> tuple[int, str, str]:
+    """
+    Запускает FFmpeg/ffprobe без блокировки event loop.
+
+    Процесс убивается по таймауту и при отмене задачи.
+
+    Args:
+        args: Команда и аргументы
+        timeout: Таймаут в секундах
+
+    Returns:
+        tuple: (код возврата, stdout, stderr)
+
+    Raises:
+        asyncio.TimeoutError: Если процесс не уложился в таймаут
+    """
+    async with _ffmpeg_semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except BaseException:
+            # Таймаут или отмена — не оставляем зависший процесс
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+    return (
+        process.returncode,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
+
 
 class WhisperService:
     """Сервис транскрибации аудио."""
 
     def __init__(self):
-        self._client: OpenAI | None = None
+        self._client: AsyncOpenAI | None = None
+        self._semaphore = asyncio.Semaphore(settings.whisper_concurrency)
 
     @property
-    def client(self) -> OpenAI:
+    def client(self) -> AsyncOpenAI:
         """Ленивая инициализация клиента."""
         if self._client is None:
-            self._client = OpenAI(api_key=settings.openai_api_key)
+            self._client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.whisper_timeout,
+                max_retries=0,  # Повторы — в transcribe_file
+            )
         return self._client
 
-    def extract_audio(self, video_path: str, output_path: str) -> bool:
+    async def extract_audio(self, video_path: str, output_path: str) -> bool:
         """
         Извлекает аудио из видеофайла и сжимает.
 
@@ -55,7 +103,7 @@ class WhisperService:
         """
         try:
             # Сжимаем в моно, 16kHz, 32kbps — оптимально для Whisper
-            result = subprocess.run([
+            returncode, _, stderr = await run_ffmpeg([
                 "ffmpeg", "-y",
                 "-i", video_path,
                 "-vn",  # Без видео
@@ -64,47 +112,178 @@ class WhisperService:
                 "-b:a", "32k",  # 32kbps
                 "-f", "mp3",
                 output_path
-            ], capture_output=True, text=True, timeout=600)
+            ], timeout=600)
 
-            if result.returncode != 0:
-                logger.error(f"FFmpeg error: {result.stderr}")
+            if returncode != 0:
+                logger.error(f"FFmpeg error: {stderr}")
                 return False
 
             return True
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             logger.error("FFmpeg timeout (>10 min)")
             return False
         except Exception as e:
             logger.error(f"Error extracting audio: {e}")
             return False
 
-    def get_audio_duration(self, audio_path: str) -> float:
+    async def get_audio_duration(self, audio_path: str) -> float:
         """Получает длительность аудио в секундах."""
         try:
-            result = subprocess.run([
+            _, stdout, _ = await run_ffmpeg([
                 "ffprobe", "-v", "error",
                 "-show_entries", "format=duration",
                 "-of", "default=noprint_wrappers=1:nokey=1",
                 audio_path
-            ], capture_output=True, text=True, timeout=30)
+            ], timeout=30)
 
-            return float(result.stdout.strip())
+            return float(stdout.strip())
         except Exception as e:
             logger.error(f"Error getting duration: {e}")
             return 0
 
-    def split_audio(self, audio_path: str, chunk_minutes: int = CHUNK_MINUTES) -> list[str]:
+    async def split_audio(self, audio_path: str, chunk_minutes: int | None = None) -> list[str] | None:
         """
         Разбивает аудио на части.
 
+        Режим задаётся WHISPER_SPLIT_MODE: "segment" — один проход FFmpeg
+        с segment-муксером, "seek" — отдельный FFmpeg на каждую часть.
+
+        Args:
+            audio_path: Путь к аудиофайлу
+            chunk_minutes: Длина части в минутах (только для "seek")
+
+        Returns:
+            list[str] | None: Список путей к частям (во временной папке,
+                              которую удаляет вызывающий) или None,
+                              если нарезать целиком не удалось
+        """
+        if settings.whisper_split_mode == "seek":
+            return await self._split_by_seek(audio_path, chunk_minutes or CHUNK_MINUTES)
+
+        chunks = await self._split_by_segments(audio_path)
+        if chunks is None:
+            logger.info("Segment split failed, falling back to per-chunk FFmpeg")
+            return await self._split_by_seek(audio_path, chunk_minutes or CHUNK_MINUTES)
+        return chunks
+
+    def _segment_seconds(self, duration: float, size_bytes: int) -> int:
+        """
+        Длина части по среднему битрейту файла.
+
+        Берём 90% от WHISPER_SIZE_LIMIT — запас на заголовки и колебания
+        битрейта. При сильно переменном битрейте (VBR mp3 без
+        перекодирования) часть всё равно может выйти больше лимита —
+        размеры частей проверяет _split_by_segments.
+        """
+        bytes_per_second = size_bytes / duration
+        return max(60, int(WHISPER_SIZE_LIMIT * 0.9 / bytes_per_second))
+
+    async def _split_by_segments(self, audio_path: str) -> list[str] | None:
+        """
+        Разбивает аудио за один проход FFmpeg (segment-муксер).
+
+        MP3 режется копированием потока без перекодирования, остальные
+        форматы перекодируются в mp3 32kbps за тот же проход. Если после
+        копирования какая-то часть больше WHISPER_SIZE_LIMIT, файл
+        режется заново с перекодированием.
+
+        Returns:
+            list[str]: Пути к частям по порядку или None при ошибке FFmpeg
+        """
+        duration = await self.get_audio_duration(audio_path)
+        if duration == 0:
+            return [audio_path]
+
+        copy_stream = audio_path.lower().endswith(".mp3")
+        if copy_stream:
+            segment_seconds = self._segment_seconds(duration, os.path.getsize(audio_path))
+            # Файл и так влезает — резать и перекодировать нечего
+            if segment_seconds >= duration:
+                return [audio_path]
+
+            chunks = await self._run_segment_split(audio_path, ["-c", "copy"], segment_seconds)
+            if chunks is None:
+                return None
+            if all(os.path.getsize(chunk) <= WHISPER_SIZE_LIMIT for chunk in chunks):
+                logger.info(f"Audio split into {len(chunks)} chunk(s) of ~{segment_seconds} s in one pass")
+                return chunks
+
+            logger.info("Stream-copied chunk exceeds Whisper limit, re-splitting with re-encode")
+            shutil.rmtree(os.path.dirname(chunks[0]), ignore_errors=True)
+
+        segment_seconds = self._segment_seconds(duration, int(duration * 32000 / 8))
+        chunks = await self._run_segment_split(
+            audio_path, ["-ac", "1", "-ar", "16000", "-b:a", "32k"], segment_seconds
+        )
+        if chunks is None:
+            return None
+        if any(os.path.getsize(chunk) > WHISPER_SIZE_LIMIT for chunk in chunks):
+            logger.error("Re-encoded chunk exceeds Whisper limit")
+            shutil.rmtree(os.path.dirname(chunks[0]), ignore_errors=True)
+            return None
+
+        logger.info(f"Audio split into {len(chunks)} chunk(s) of ~{segment_seconds} s in one pass")
+        return chunks
+
+    async def _run_segment_split(
+        self,
+        audio_path: str,
+        codec_args: list[str],
+        segment_seconds: int
+    ) -> list[str] | None:
+        """
+        Запускает FFmpeg с segment-муксером во временную папку.
+
+        Returns:
+            list[str] | None: Пути к частям по порядку или None при ошибке
+                              (временная папка тогда уже удалена)
+        """
+        temp_dir = tempfile.mkdtemp()
+        pattern = os.path.join(temp_dir, "chunk_%03d.mp3")
+
+        try:
+            returncode, _, stderr = await run_ffmpeg([
+                "ffmpeg", "-y",
+                "-i", audio_path,
+                "-vn",
+                *codec_args,
+                "-f", "segment",
+                "-segment_time", str(segment_seconds),
+                "-reset_timestamps", "1",
+                pattern
+            ], timeout=600)
+        except Exception as e:
+            logger.error(f"Error segmenting audio: {e}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+
+        if returncode != 0:
+            logger.error(f"FFmpeg segment error: {stderr}")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+
+        chunks = sorted(
+            os.path.join(temp_dir, name)
+            for name in os.listdir(temp_dir)
+            if name.startswith("chunk_")
+        )
+        if not chunks:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+        return chunks
+
+    async def _split_by_seek(self, audio_path: str, chunk_minutes: int = CHUNK_MINUTES) -> list[str] | None:
+        """
+        Разбивает аудио на части отдельным FFmpeg на каждую часть (-ss/-t).
+
         Args:
             audio_path: Путь к аудиофайлу
             chunk_minutes: Длина части в минутах
 
         Returns:
-            list[str]: Список путей к частям
+            list[str] | None: Список путей к частям или None, если часть не нарезалась
         """
-        duration = self.get_audio_duration(audio_path)
+        duration = await self.get_audio_duration(audio_path)
         if duration == 0:
             return [audio_path]
 
@@ -114,52 +293,70 @@ class WhisperService:
         if num_chunks == 1:
             return [audio_path]
 
-        chunks = []
         temp_dir = tempfile.mkdtemp()
 
-        for i in range(num_chunks):
+        async def cut(i: int) -> str | None:
             start = i * chunk_seconds
             output = os.path.join(temp_dir, f"chunk_{i}.mp3")
 
             try:
-                subprocess.run([
+                returncode, _, stderr = await run_ffmpeg([
                     "ffmpeg", "-y",
                     "-i", audio_path,
                     "-ss", str(start),
                     "-t", str(chunk_seconds),
                     "-ac", "1", "-ar", "16000", "-b:a", "32k",
                     output
-                ], check=True, capture_output=True, timeout=120)
-                chunks.append(output)
+                ], timeout=120)
+                if returncode != 0:
+                    logger.error(f"Error splitting chunk {i}: {stderr}")
+                    return None
+                return output
             except Exception as e:
                 logger.error(f"Error splitting chunk {i}: {e}")
+                return None
 
-        return chunks if chunks else [audio_path]
+        # Части режутся параллельно в пределах общего лимита FFmpeg
+        results = await asyncio.gather(*(cut(i) for i in range(num_chunks)))
+        # Без любой из частей транскрипция вышла бы неполной
+        if not all(results):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return None
+        return results
 
-    def transcribe_file(self, audio_path: str) -> str:
+    async def transcribe_file(self, audio_path: str) -> str:
         """
         Транскрибирует один аудиофайл через Whisper API.
 
+        Неудачные запросы повторяются до WHISPER_RETRIES раз с паузой 2, 4, 8... сек.
+
         Args:
             audio_path: Путь к аудиофайлу
 
         Returns:
-            str: Текст транскрипции
+            str | None: Текст транскрипции или None, если все попытки неудачны
         """
-        try:
-            with open(audio_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="ru",
-                    response_format="text"
-                )
-            return response
-        except Exception as e:
-            logger.error(f"Whisper API error: {e}")
-            return ""
+        attempts = settings.whisper_retries + 1
+
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self._semaphore:
+                    with open(audio_path, "rb") as audio_file:
+                        response = await self.client.audio.transcriptions.create(
+                            model="whisper-1",
+                            file=audio_file,
+                            language="ru",
+                            response_format="text"
+                        )
+                return response
+            except Exception as e:
+                logger.error(f"Whisper API error ({attempt}/{attempts}) for {audio_path}: {e}")
+                if attempt < attempts:
+                    await asyncio.sleep(2 ** attempt)
 
-    async def transcribe(self, file_path: str, is_video: bool = False) -> str:
+        return None
+
+    async def transcribe(self, file_path: str, is_video: bool = False) -> tuple[str, bool]:
         """
         Полный процесс транскрибации файла.
 
@@ -168,9 +365,11 @@ class WhisperService:
             is_video: True если это видеофайл
 
         Returns:
-            str: Полный текст транскрипции
+            tuple[str, bool]: Текст транскрипции и признак полноты
+                              (False — часть записи не распознана)
         """
         temp_files = []
+        temp_dirs = set()
 
         try:
             # Если видео — извлекаем аудио
@@ -179,8 +378,8 @@ class WhisperService:
                 temp_files.append(audio_path)
 
                 logger.info(f"Extracting audio from {file_path}")
-                if not self.extract_audio(file_path, audio_path):
-                    return ""
+                if not await self.extract_audio(file_path, audio_path):
+                    return "", False
             else:
                 audio_path = file_path
 
@@ -191,20 +390,26 @@ class WhisperService:
             # Если больше лимита — разбиваем
             if file_size > WHISPER_SIZE_LIMIT:
                 logger.info("File too large, splitting into chunks")
-                chunks = self.split_audio(audio_path)
-                temp_files.extend(chunks)
+                chunks = await self.split_audio(audio_path)
+                if chunks is None:
+                    return "", False
+                temp_dirs.update(
+                    os.path.dirname(chunk) for chunk in chunks if chunk != audio_path
+                )
             else:
                 chunks = [audio_path]
 
-            # Транскрибируем каждую часть
-            transcripts = []
-            for i, chunk in enumerate(chunks):
-                logger.info(f"Transcribing chunk {i+1}/{len(chunks)}")
-                text = self.transcribe_file(chunk)
-                if text:
-                    transcripts.append(text)
+            # Транскрибируем части параллельно (не больше WHISPER_CONCURRENCY),
+            # gather сохраняет порядок частей
+            logger.info(f"Transcribing {len(chunks)} chunk(s)")
+            transcripts = await asyncio.gather(*(
+                self.transcribe_file(chunk) for chunk in chunks
+            ))
 
-            return "\n\n".join(transcripts)
+            failed = sum(text is None for text in transcripts)
+            if failed:
+                logger.error(f"{failed} of {len(chunks)} chunk(s) not transcribed")
+            return "\n\n".join(text for text in transcripts if text), not failed
 
         finally:
             # Очищаем временные файлы
@@ -214,6 +419,119 @@ class WhisperService:
                         os.remove(temp_file)
                 except Exception:
                     pass
+            for temp_dir in temp_dirs:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+    async def transcribe_stream(
+        self,
+        file_path: str,
+        is_video: bool = False,
+        on_progress: Callable[[int, int | None], Awaitable[None]] | None = None
+    ) -> tuple[str, bool]:
+        """
+        Потоковая транскрибация: извлечение, нарезка и распознавание идут внахлёст.
+
+        Один процесс FFmpeg извлекает аудио и режет его на части
+        (WHISPER_STREAM_SEGMENT_SECONDS), дописывая готовые в segment_list.
+        Каждая готовая часть сразу уходит в Whisper, не дожидаясь конца файла.
+
+        Args:
+            file_path: Путь к файлу (видео или аудио)
+            is_video: True если это видеофайл
+            on_progress: Колбэк (распознано частей, всего частей или None)
+
+        Returns:
+            tuple[str, bool]: Текст транскрипции и признак полноты
+                              (False — часть записи не распознана)
+        """
+        # Аудио, которое Whisper примет как есть, — без FFmpeg (как в transcribe)
+        if not is_video and os.path.getsize(file_path) <= WHISPER_SIZE_LIMIT:
+            text = await self.transcribe_file(file_path)
+            if on_progress:
+                await on_progress(1, 1)
+            return text or "", text is not None
+
+        duration = await self.get_audio_duration(file_path)
+        segment_seconds = min(
+            settings.whisper_stream_segment_seconds,
+            self._segment_seconds(1, 32000 // 8),
+        )
+        expected = math.ceil(duration / segment_seconds) if duration else None
+        temp_dir = tempfile.mkdtemp()
+        list_path = os.path.join(temp_dir, "segments.csv")
+
+        ffmpeg = asyncio.create_task(run_ffmpeg([
+            "ffmpeg", "-y",
+            "-i", file_path,
+            "-vn",
+            "-ac", "1", "-ar", "16000", "-b:a", "32k",
+            "-f", "segment",
+            "-segment_time", str(segment_seconds),
+            "-reset_timestamps", "1",
+            "-segment_list", list_path,
+            "-segment_list_type", "csv",
+            "-segment_list_flush", "1",
+            os.path.join(temp_dir, "chunk_%03d.mp3")
+        ], timeout=600))
+
+        tasks: list[asyncio.Task] = []
+        done = 0
+
+        async def transcribe_chunk(chunk_path: str) -> str | None:
+            nonlocal done
+            text = await self.transcribe_file(chunk_path)
+            done += 1
+            if on_progress:
+                await on_progress(done, expected)
+            return text
+
+        def collect_new_chunks():
+            if not os.path.exists(list_path):
+                return
+            with open(list_path, encoding="utf-8") as f:
+                names = [line.split(",", 1)[0] for line in f if line.strip()]
+            for name in names[len(tasks):]:
+                tasks.append(asyncio.create_task(
+                    transcribe_chunk(os.path.join(temp_dir, name))
+                ))
+
+        try:
+            while not ffmpeg.done():
+                collect_new_chunks()
+                await asyncio.wait({ffmpeg}, timeout=0.5)
+
+            returncode, _, stderr = ffmpeg.result()
+            collect_new_chunks()
+
+            if returncode != 0 and not tasks:
+                logger.error(f"FFmpeg stream error: {stderr}")
+                return await self.transcribe(file_path, is_video=is_video)
+            if returncode != 0:
+                logger.error(f"FFmpeg stream stopped early, using {len(tasks)} chunk(s): {stderr}")
+
+            expected = len(tasks)
+            logger.info(f"Streamed {len(tasks)} chunk(s) of ~{segment_seconds} s to Whisper")
+            transcripts = await asyncio.gather(*tasks)
+
+            failed = sum(text is None for text in transcripts)
+            if failed:
+                logger.error(f"{failed} of {len(tasks)} streamed chunk(s) not transcribed")
+            complete = returncode == 0 and not failed
+            return "\n\n".join(text for text in transcripts if text), complete
+
+        except asyncio.TimeoutError:
+            logger.error("FFmpeg timeout (>10 min)")
+            return "", False
+        except Exception as e:
+            logger.error(f"Error in streaming transcription: {e}")
+            return "", False
+
+        finally:
+            ffmpeg.cancel()
+            for task in tasks:
+                task.cancel()
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 # Глобальный экземпляр
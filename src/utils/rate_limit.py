@@ -0,0 +1,30 @@
+"""
+Ограничение частоты асинхронных вызовов.
+
+Используется для Telegram API и других внешних сервисов с лимитами.
+"""
+
+import asyncio
+
+
+class RateLimiter:
+    """Пропускает не больше rate вызовов в секунду (равномерно)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def wait(self) -> None:
+        """Ждёт своей очереди на вызов."""
+        if not self.interval:
+            return
+
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -214,6 +214,187 @@ CREATE INDEX IF NOT EXISTS idx_reminders_project
     ON reminders(project_id, status);
 
 
+-- ============================================
+-- 7. chat_log — эскалации неотвеченных сообщений
+-- ============================================
+
+-- Номер следующей попытки напоминания (0 = 15 мин, 1 = 30 мин, 2 = 1 час)
+ALTER TABLE chat_log ADD COLUMN IF NOT EXISTS escalation_attempt INT DEFAULT 0;
+
+-- Индекс для восстановления эскалаций при старте бота
+CREATE INDEX IF NOT EXISTS idx_chat_log_waiting
+    ON chat_log(pending_until) WHERE status = 'waiting';
+CREATE INDEX IF NOT EXISTS idx_chat_log_waiting_id
+    ON chat_log(id) WHERE status = 'waiting';
+
+-- Индекс для поиска ответов проджектов
+CREATE INDEX IF NOT EXISTS idx_chat_log_project_answers
+    ON chat_log(chat_id, message_id) WHERE is_project;
+
+-- Первый ответ проджекта для каждой пары (chat_id, message_id) — одним запросом
+CREATE OR REPLACE FUNCTION find_project_answers(p_chat_ids TEXT[], p_message_ids BIGINT[])
+RETURNS TABLE (
+    chat_id TEXT,
+    after_message_id BIGINT,
+    message_id BIGINT,
+    from_name TEXT,
+    text TEXT,
+    "timestamp" TIMESTAMPTZ
+)
+LANGUAGE sql STABLE AS $$
+    SELECT t.chat_id, t.after_message_id, a.message_id, a.from_name, a.text, a."timestamp"
+    FROM unnest(p_chat_ids, p_message_ids) AS t(chat_id, after_message_id)
+    CROSS JOIN LATERAL (
+        SELECT c.message_id::BIGINT AS message_id, c.from_name, c.text, c."timestamp"
+        FROM chat_log c
+        WHERE c.chat_id = t.chat_id
+          AND c.is_project
+          AND c.message_id > t.after_message_id
+        ORDER BY c.message_id
+        LIMIT 1
+    ) a;
+$$;
+
+-- Закрытие многих отвеченных сообщений одним запросом (восстановление при старте)
+CREATE OR REPLACE FUNCTION mark_messages_answered(
+    p_ids BIGINT[],
+    p_answered_by TEXT[],
+    p_answered_message_ids BIGINT[],
+    p_answered_texts TEXT[]
+)
+RETURNS INT
+LANGUAGE sql VOLATILE AS $$
+    WITH updated AS (
+        UPDATE chat_log c
+        SET status = 'answered',
+            answered_by = a.answered_by,
+            answered_message_id = a.answered_message_id,
+            answered_text = a.answered_text,
+            answered_at = NOW()
+        FROM unnest(p_ids, p_answered_by, p_answered_message_ids, p_answered_texts)
+            AS a(id, answered_by, answered_message_id, answered_text)
+        WHERE c.id = a.id AND c.status = 'waiting'
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INT FROM updated;
+$$;
+
+
+-- ============================================
+-- 8. Последняя активность по чатам
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_chat_log_chat_timestamp
+    ON chat_log(chat_id, "timestamp" DESC);
+
+-- Время последнего сообщения для каждого чата — одним запросом по индексу
+CREATE OR REPLACE FUNCTION chat_last_activity(p_chat_ids TEXT[])
+RETURNS TABLE (chat_id TEXT, last_message_at TIMESTAMPTZ)
+LANGUAGE sql STABLE AS $$
+    SELECT t.chat_id, a."timestamp"
+    FROM unnest(p_chat_ids) AS t(chat_id)
+    CROSS JOIN LATERAL (
+        SELECT c."timestamp"
+        FROM chat_log c
+        WHERE c.chat_id = t.chat_id
+        ORDER BY c."timestamp" DESC
+        LIMIT 1
+    ) a;
+$$;
+
+
+-- ============================================
+-- 9. Таблица chat_activity — последнее сообщение по чату
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS chat_activity (
+    chat_id TEXT PRIMARY KEY,               -- ID чата в Telegram
+    last_message_at TIMESTAMPTZ NOT NULL,   -- Время последнего сообщения
+    last_message_id BIGINT,                 -- ID последнего сообщения
+    last_is_project BOOLEAN                 -- Последним писал проджект?
+);
+
+-- Обновляется триггером при каждой вставке в chat_log
+CREATE OR REPLACE FUNCTION touch_chat_activity()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO chat_activity (chat_id, last_message_at, last_message_id, last_is_project)
+    VALUES (NEW.chat_id, NEW."timestamp", NEW.message_id, NEW.is_project)
+    ON CONFLICT (chat_id) DO UPDATE
+        SET last_message_at = EXCLUDED.last_message_at,
+            last_message_id = EXCLUDED.last_message_id,
+            last_is_project = EXCLUDED.last_is_project
+        WHERE chat_activity.last_message_at <= EXCLUDED.last_message_at;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_chat_log_activity ON chat_log;
+CREATE TRIGGER trg_chat_log_activity
+    AFTER INSERT ON chat_log
+    FOR EACH ROW EXECUTE FUNCTION touch_chat_activity();
+
+-- Первичное заполнение из существующей истории
+INSERT INTO chat_activity (chat_id, last_message_at, last_message_id, last_is_project)
+SELECT DISTINCT ON (chat_id) chat_id, "timestamp", message_id, is_project
+FROM chat_log
+ORDER BY chat_id, "timestamp" DESC
+ON CONFLICT (chat_id) DO NOTHING;
+
+
+-- ============================================
+-- 10. Ежемесячная допродажа — история чатов и прогресс
+-- ============================================
+
+-- Последние N сообщений для каждого чата — одним запросом
+CREATE OR REPLACE FUNCTION recent_messages_for_chats(p_chat_ids TEXT[], p_limit INT DEFAULT 20)
+RETURNS TABLE (chat_id TEXT, message_id BIGINT, from_name TEXT, text TEXT, is_project BOOLEAN, "timestamp" TIMESTAMPTZ)
+LANGUAGE sql STABLE AS $$
+    SELECT t.chat_id, m.message_id, m.from_name, m.text, m.is_project, m."timestamp"
+    FROM unnest(p_chat_ids) AS t(chat_id)
+    CROSS JOIN LATERAL (
+        SELECT c.message_id::BIGINT AS message_id, c.from_name, c.text, c.is_project, c."timestamp"
+        FROM chat_log c
+        WHERE c.chat_id = t.chat_id
+        ORDER BY c.message_id DESC
+        LIMIT p_limit
+    ) m;
+$$;
+
+-- Запуски допродажи (для возобновления после рестарта)
+CREATE TABLE IF NOT EXISTS upsell_runs (
+    period TEXT PRIMARY KEY,                -- Месяц запуска, YYYY-MM
+    status TEXT NOT NULL,                   -- started, completed
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Прогресс по чатам: сгенерированные и отправленные предложения
+CREATE TABLE IF NOT EXISTS upsell_progress (
+    period TEXT NOT NULL,                   -- Месяц запуска, YYYY-MM
+    chat_id TEXT NOT NULL,                  -- ID чата
+    project_id BIGINT,                      -- Кому отправить
+    chat_name TEXT,
+    suggestion TEXT,                        -- Сгенерированное предложение
+    status TEXT NOT NULL,                   -- generated, sent
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (period, chat_id)
+);
+
+
+-- ============================================
+-- 11. Пакетная запись chat_log (CHAT_LOG_WRITE_MODE=buffered)
+-- ============================================
+
+-- Резервирует блок id chat_log: бот присваивает id сам и пишет пачками
+-- (дубли отсекает уникальный thread_key: ON CONFLICT DO NOTHING)
+CREATE OR REPLACE FUNCTION reserve_chat_log_ids(p_count INT DEFAULT 100)
+RETURNS SETOF BIGINT
+LANGUAGE sql VOLATILE AS $$
+    SELECT nextval(pg_get_serial_sequence('chat_log', 'id'))
+    FROM generate_series(1, p_count);
+$$;
+
 -- ============================================
 -- ПОЛЕЗНЫЕ ЗАПРОСЫ
 -- ============================================